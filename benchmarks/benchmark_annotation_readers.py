@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+"""
+Peak RSS, time and DataFrame size of the ANNOVAR multianno and InterVar readers on
+synthetic tables (1M variants by default): a plain pd.read_csv of every column, as
+merge_annotations.py reads them by default (and parse_intervar.py did before), against
+the column-pruned, typed read_annovar / read_table of --prune-columns with the c engine
+and, when pyarrow is installed, the pyarrow engine. Each run is a separate process so ru_maxrss is its own peak.
+
+usage: benchmark_annotation_readers.py [--variants 1000000]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts")
+sys.path.insert(0, SCRIPTS)
+
+from synthetic_vcf import annovar_multianno_lines, intervar_lines, write_lines  # noqa: E402
+
+READERS = ("read_csv", "c", "pyarrow")
+
+
+def read(table, reader, path):
+    from annotation_tables import read_table
+    from merge_annotations import read_annovar
+    from parse_intervar import INTERVAR_TABLE_DTYPES
+
+    if reader == "read_csv":
+        return pd.read_csv(path, sep="\t")
+    if table == "annovar":
+        return read_annovar(path, engine=reader)
+    return read_table(path, INTERVAR_TABLE_DTYPES, reader)
+
+
+def child(table, reader, path):
+    """Read one table in this process and print time, peak RSS and frame size as JSON."""
+    start = time.perf_counter()
+    frame = read(table, reader, path)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        "seconds": elapsed,
+        # ru_maxrss is in kilobytes on Linux
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "frame_mb": frame.memory_usage(deep=True).sum() / 1e6,
+        "columns": frame.shape[1],
+    }))
+
+
+def has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the ANNOVAR / InterVar table readers")
+    parser.add_argument("--variants", type=int, default=1000000, help="Variants in the synthetic tables")
+    parser.add_argument("--child", nargs=3, metavar=("TABLE", "READER", "IN"), help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    readers = READERS if has_pyarrow() else READERS[:-1]
+    with tempfile.TemporaryDirectory() as tmp:
+        tables = {
+            "annovar": (os.path.join(tmp, "sample.hg38_multianno.txt"), annovar_multianno_lines),
+            "intervar": (os.path.join(tmp, "sample.hg38_multianno.txt.intervar"), intervar_lines),
+        }
+        for table, (path, lines) in tables.items():
+            write_lines(path, lines(args.variants))
+            print(f"{table}: {args.variants} variants, {os.path.getsize(path) / 1e6:.1f} MB")
+            for reader in readers:
+                result = json.loads(subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", table, reader, path],
+                    stdout=subprocess.PIPE, check=True,
+                ).stdout)
+                print(f"  {reader:10s} {result['columns']:3d} columns {result['seconds']:8.2f} s  "
+                      f"peak RSS {result['max_rss_mb']:8.1f} MB  frame {result['frame_mb']:8.1f} MB")
+        if len(readers) < len(READERS):
+            print("pyarrow not installed: pyarrow engine skipped")
+
+
+if __name__ == "__main__":
+    main()
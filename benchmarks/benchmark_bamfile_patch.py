@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+"""
+Peak RSS and time of the QNAME -> RG lookup of bamfile_patch.py patch-bam for a
+20M-read patch (one qname_rg_map.tsv row per read pair, every read looked up): the
+hashed QnameReadGroups against the previous pd.read_csv + Series.to_dict map
+(reproduced here). Each run is a separate process so ru_maxrss is its own peak, and
+both check the read group of every read. Extraction and patch-bam are then run end to
+end on a small synthetic BAM, with the QNAME map and with the XR tag of
+--original_rg_tag, and the patched read groups checked against the original BAM. A
+QNAME missing from the map is checked to raise KeyError, also with a forced collision
+of its key hash.
+
+usage: benchmark_bamfile_patch.py [--reads 20000000] [--bam-pairs 100000]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts")
+sys.path.insert(0, SCRIPTS)
+
+from synthetic_bam import illumina_qname, write_bam  # noqa: E402
+
+IMPLEMENTATIONS = ("pandas_dict", "hashed")
+READ_GROUPS = [f"HVWJKDSXY.{i}" for i in range(1, 5)]
+BATCH = 100000
+
+
+def write_qname_rg_map(path, num_pairs):
+    with open(path, "w") as ofile:
+        ofile.write("QNAME\tRG\n")
+        for i in range(num_pairs):
+            ofile.write(f"{illumina_qname(i)}\t{READ_GROUPS[i % len(READ_GROUPS)]}\n")
+
+
+def pandas_dict(qname_rg_map):
+    import pandas as pd
+
+    qname_rg_df = pd.read_csv(qname_rg_map, sep="\t")
+    original_read_groups = pd.Series(qname_rg_df["RG"].values, index=qname_rg_df["QNAME"]).to_dict()
+    return lambda qnames: [original_read_groups[qname] for qname in qnames]
+
+
+def hashed(qname_rg_map):
+    from bamfile_patch import QnameReadGroups
+
+    return QnameReadGroups(qname_rg_map).lookup
+
+
+def child(implementation, qname_rg_map, num_pairs):
+    """Build one lookup in this process, look up both reads of every pair, print JSON."""
+    num_pairs = int(num_pairs)
+    start = time.perf_counter()
+    lookup = {"pandas_dict": pandas_dict, "hashed": hashed}[implementation](qname_rg_map)
+    built = time.perf_counter()
+    # ru_maxrss is in kilobytes on Linux
+    build_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    for first in range(0, num_pairs, BATCH):
+        pairs = range(first, min(first + BATCH, num_pairs))
+        qnames = [illumina_qname(i) for i in pairs for _ in range(2)]
+        expected = [READ_GROUPS[i % len(READ_GROUPS)] for i in pairs for _ in range(2)]
+        if lookup(qnames) != expected:
+            sys.exit(f"ERROR: {implementation} read groups differ")
+    print(json.dumps({
+        "build_seconds": built - start,
+        "lookup_seconds": time.perf_counter() - built,
+        "build_rss_mb": build_rss,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def check_missing_qnames(tmp, num_pairs):
+    """QNAMEs missing from the map must raise KeyError, also when their 48-bit key hash is
+    made to collide with a key of the map, which only the second hash can catch.
+    """
+    import numpy as np
+    from bamfile_patch import HASH_MASK, QnameReadGroups, qname_hashes
+
+    qname_rg_map = os.path.join(tmp, "small_qname_rg_map.tsv")
+    write_qname_rg_map(qname_rg_map, num_pairs)
+    read_groups = QnameReadGroups(qname_rg_map)
+    missing = illumina_qname(num_pairs)
+    # a key with the missing QNAME's hash, as a 48-bit collision would leave
+    colliding = (qname_hashes([missing.encode()]) & HASH_MASK)[0]
+    read_groups.keys = np.sort(np.append(read_groups.keys, colliding))
+    for qnames in ([missing], [illumina_qname(0), missing]):
+        try:
+            read_groups.lookup(qnames)
+        except KeyError as error:
+            if error.args[0] != missing:
+                sys.exit(f"ERROR: KeyError for {error.args[0]} instead of {missing}")
+        else:
+            sys.exit(f"ERROR: {missing} is not in the map but was given a read group")
+    print("missing QNAME raises KeyError, also with a colliding 48-bit key hash")
+
+
+def extract_and_patch(tmp, original, mode):
+    """Extract the non-primary reads of original, strip their RG as realignment would and
+    patch it back, with the QNAME map or the --original_rg_tag XR tag. Returns the patched BAM.
+    """
+    import pysam
+
+    odir = os.path.join(tmp, mode)
+    os.makedirs(odir)
+    extract_options = ["--original_rg_tag", "XR"] if mode == "tag" else []
+    subprocess.run([sys.executable, os.path.join(SCRIPTS, "bamfile_extract_nonprimary_reads.py"), "--original_bam_path", original, "-odir", odir]
+                   + extract_options, stdout=subprocess.DEVNULL, check=True)
+    realigned = os.path.join(odir, "realigned.bam")
+    with pysam.AlignmentFile(os.path.join(odir, "sample.non_primary.bam")) as bam_in, pysam.AlignmentFile(realigned, "wb", template=bam_in) as bam_out:
+        for read in bam_in:
+            read.set_tag("RG", "realigned")
+            bam_out.write(read)
+    patch_options = ["--original_rg_tag", "XR"] if mode == "tag" else ["--qname_rg_map", os.path.join(odir, "sample.qname_rg_map.tsv")]
+    subprocess.run([sys.executable, os.path.join(SCRIPTS, "bamfile_patch.py"), "patch-bam", "--non_primary_bam_path", realigned,
+                    "--original_bam_path", original, "--sample_id", "sample", "-odir", odir] + patch_options, check=True)
+    return os.path.join(odir, "sample.patch_rg_update.bam")
+
+
+def check_patch_bam(tmp, num_pairs):
+    """Every patched read of a small BAM must get its original RG back, and the QNAME map
+    and XR tag modes must write the same BAM.
+    """
+    import pysam
+
+    original = os.path.join(tmp, "sample.bam")
+    write_bam(original, num_pairs)
+    patched = {mode: extract_and_patch(tmp, original, mode) for mode in ("map", "tag")}
+    with pysam.AlignmentFile(original) as bam:
+        original_read_groups = {read.query_name: read.get_tag("RG") for read in bam.fetch(until_eof=True)}
+    reads = 0
+    with pysam.AlignmentFile(patched["map"]) as bam:
+        for read in bam.fetch(until_eof=True):
+            if read.get_tag("RG") != original_read_groups[read.query_name]:
+                sys.exit(f"ERROR: {read.query_name} patched with the wrong RG")
+            reads += 1
+    with open(patched["map"], "rb") as map_bam, open(patched["tag"], "rb") as tag_bam:
+        if map_bam.read() != tag_bam.read():
+            sys.exit("ERROR: --qname_rg_map and --original_rg_tag patches differ")
+    print(f"patch-bam: {reads} reads of a {2 * num_pairs}-read BAM patched with their original RG, "
+          "identically with --qname_rg_map and --original_rg_tag XR")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark bamfile_patch.py QNAME -> RG lookup memory")
+    parser.add_argument("--reads", type=int, default=20000000, help="Reads in the patch BAM (read pairs in the QNAME map: reads / 2)")
+    parser.add_argument("--bam-pairs", type=int, default=100000, help="Read pairs of the BAM patch-bam is checked on")
+    parser.add_argument("--child", nargs=3, metavar=("IMPL", "MAP", "PAIRS"), help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        qname_rg_map = os.path.join(tmp, "qname_rg_map.tsv")
+        num_pairs = args.reads // 2
+        write_qname_rg_map(qname_rg_map, num_pairs)
+        print(f"{args.reads} reads, {num_pairs} QNAMEs, map {os.path.getsize(qname_rg_map) / 1e6:.0f} MB")
+        for implementation in IMPLEMENTATIONS:
+            result = json.loads(subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", implementation, qname_rg_map, str(num_pairs)],
+                stdout=subprocess.PIPE, check=True,
+            ).stdout)
+            print(f"{implementation:12s} build {result['build_seconds']:7.1f} s  lookup {result['lookup_seconds']:7.1f} s  "
+                  f"RSS after build {result['build_rss_mb']:8.0f} MB  peak RSS {result['max_rss_mb']:8.0f} MB")
+        check_missing_qnames(tmp, args.bam_pairs)
+        check_patch_bam(tmp, args.bam_pairs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+"""
+Wall time of bamfile_extract_nonprimary_reads.py and bamfile_patch.py patch-bam with 1,
+4 and 8 htslib threads and BGZF compression levels 0, 1 and the default, on a
+synthetic coordinate-sorted BAM (1M read pairs by default). Patching uses the XR tag
+of --original_rg_tag so only BAM I/O and the read loop are timed. Every run's
+non_primary.bam and patched BAM are checked to hold the same reads as the
+single-threaded default-level run.
+
+usage: benchmark_bamfile_threads.py [--pairs 1000000] [--threads 1 4 8] [--levels default 1 0]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pysam
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts")
+sys.path.insert(0, SCRIPTS)
+
+from synthetic_bam import write_bam  # noqa: E402
+
+
+def timed_run(command):
+    start = time.perf_counter()
+    subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+def bam_reads(path):
+    with pysam.AlignmentFile(path) as bam:
+        return [read.to_string() for read in bam.fetch(until_eof=True)]
+
+
+def run(original, odir, threads, level):
+    """Extract and patch with threads and level; returns (extract s, patch s, non_primary.bam, patched BAM)."""
+    os.makedirs(odir)
+    options = ["--threads", str(threads)] + ([] if level == "default" else ["--compression_level", level])
+    extract_seconds = timed_run([sys.executable, os.path.join(SCRIPTS, "bamfile_extract_nonprimary_reads.py"),
+                                 "--original_bam_path", original, "-odir", odir, "--original_rg_tag", "XR"] + options)
+    non_primary = os.path.join(odir, "sample.non_primary.bam")
+    patch_seconds = timed_run([sys.executable, os.path.join(SCRIPTS, "bamfile_patch.py"), "patch-bam", "--non_primary_bam_path", non_primary,
+                               "--original_bam_path", original, "--original_rg_tag", "XR", "--sample_id", "sample", "-odir", odir] + options)
+    return extract_seconds, patch_seconds, non_primary, os.path.join(odir, "sample.patch_rg_update.bam")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark htslib threads and compression levels of the BAM patch tools")
+    parser.add_argument("--pairs", type=int, default=1000000, help="Read pairs in the synthetic BAM")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8], help="Thread counts to time")
+    parser.add_argument("--levels", nargs="+", default=["default", "1", "0"], help="Compression levels to time ('default': htslib's)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        original = os.path.join(tmp, "sample.bam")
+        write_bam(original, args.pairs)
+        print(f"{2 * args.pairs} reads, {os.path.getsize(original) / 1e6:.0f} MB, {os.cpu_count()} CPUs")
+        expected = None
+        for level in args.levels:
+            for threads in args.threads:
+                extract_seconds, patch_seconds, non_primary, patched = run(original, os.path.join(tmp, f"{level}_{threads}"), threads, level)
+                print(f"level {level:>7s} threads {threads:2d}  extract {extract_seconds:7.1f} s  patch {patch_seconds:7.1f} s  "
+                      f"non_primary.bam {os.path.getsize(non_primary) / 1e6:7.1f} MB")
+                reads = (bam_reads(non_primary), bam_reads(patched))
+                if expected is None:
+                    expected = reads
+                elif reads != expected:
+                    sys.exit(f"ERROR: level {level} threads {threads} output differs")
+        print("outputs agree")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+"""
+Records/sec of the genotype_union.py engines on a synthetic 3xN-sample merged VCF.
+Every engine's output is checked to be byte-identical to the legacy engine.
+
+usage: benchmark_genotype_union.py [--samples 100 1000] [--records 2000]
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+
+import genotype_union  # noqa: E402
+from synthetic_vcf import write_merged_vcf  # noqa: E402
+
+HEADER_ARGS = ("ts", "someversion", "genotype_union.py", "genotype_union.py")
+
+
+def run_legacy(path):
+    out = io.StringIO()
+    genotype_union.legacy_union(path, out, *HEADER_ARGS)
+    return out.getvalue().encode()
+
+
+def stream_runner(engine_class):
+    def run(path):
+        out = io.BytesIO()
+        with open(path, "rb") as in_handle:
+            genotype_union.stream_union(in_handle, out, *HEADER_ARGS, engine_class=engine_class)
+        return out.getvalue()
+    return run
+
+
+ENGINES = {
+    "legacy": run_legacy,
+    "stream": stream_runner(genotype_union.UnionEngine),
+}
+
+
+def time_engine(engine, path, repeat):
+    best = None
+    output = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = ENGINES[engine](path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, output
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark genotype_union.py engines")
+    parser.add_argument("--samples", type=int, nargs="+", default=[100, 1000], help="Samples per caller block")
+    parser.add_argument("--records", type=int, default=2000, help="Number of records in the synthetic VCF")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeats per engine; the best time is reported")
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=list(ENGINES))
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    print("samples\tengine\tseconds\trecords_per_sec\tspeedup\tidentical")
+    with tempfile.TemporaryDirectory() as tmp:
+        for num_samples in args.samples:
+            path = os.path.join(tmp, f"merged.{num_samples}.vcf")
+            write_merged_vcf(path, num_samples, args.records)
+            reference_time, reference = time_engine("legacy", path, args.repeat)
+            for engine in args.engines:
+                if engine == "legacy":
+                    elapsed, output = reference_time, reference
+                else:
+                    elapsed, output = time_engine(engine, path, args.repeat)
+                print(
+                    f"{num_samples}\t{engine}\t{elapsed:.3f}\t{args.records / elapsed:,.0f}"
+                    f"\t{reference_time / elapsed:.2f}x\t{output == reference}"
+                )
+
+
+if __name__ == "__main__":
+    main()
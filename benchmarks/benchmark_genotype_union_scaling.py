@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+"""
+Per-record cost of genotype_union.py as the cohort grows (100 -> 10,000 samples).
+With positional column indexing the cost per record per sample should stay flat.
+
+Before timing, a hand-checked record with duplicate genotype strings (including
+bare "." columns that match the ID/QUAL fields) is run through every engine, and
+through --summary, whose per-sample counts must cope with the HC samples truncated
+to "./." in the output.
+
+usage: benchmark_genotype_union_scaling.py [--samples 100 1000 10000] [--records 50]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmark_genotype_union import ENGINES, time_engine
+from synthetic_vcf import write_merged_vcf
+
+DUPLICATE_GT_HEADER = "\t".join(
+    ["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT"]
+    + ["A", "B", "C", "D", "2:A", "2:B", "2:C", "2:D", "3:A", "3:B", "3:C", "3:D"]
+)
+DUPLICATE_GT_RECORD = "\t".join(
+    ["chr1", "100", ".", "A", "G", ".", "PASS", "HC_DP=40;DV_DP=38", "GT:HC_GT:HC_DP:DV_GT:DV_DP"]
+    + ["0/1:0/1:10:.:.", "0/1:0/1:10:.:.", ".", "."]
+    + ["0/1:.:.:0/1:12", "1/1:.:.:1/1:9", "0/0:.:.:0/0:7", "0/0:.:.:0/0:8"]
+    + ["./.:.:.:.:."] * 4
+)
+DUPLICATE_GT_EXPECTED = "\t".join(
+    ["chr1", "100", ".", "A", "G", ".", "twoCallers", "HC_DP=40;DV_DP=38;set=HC-DV",
+     "GT:HC_GT:HC_DP:DV_GT:DV_DP:concensus_GT:dv_priority_GT"]
+    + ["0/1:0/1:10:0/1:12:0/1:0/1", "./.:0/1:10:1/1:9:./.:1/1", "./.:./.:0/0", "./.:./.:0/0"]
+)
+# [concordant, discordant, missing] of samples A-D in --summary
+DUPLICATE_GT_SAMPLE_COUNTS = [[1, 0, 0], [0, 1, 0], [0, 0, 1], [0, 0, 1]]
+GENOTYPE_UNION = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts", "genotype_union.py")
+
+
+def check_duplicate_genotype_strings(tmp):
+    path = os.path.join(tmp, "duplicate_gt.vcf")
+    with open(path, "w") as ofile:
+        ofile.write(DUPLICATE_GT_HEADER + "\n" + DUPLICATE_GT_RECORD + "\n")
+    ok = True
+    for engine, run in ENGINES.items():
+        record = run(path).decode().rstrip("\n").split("\n")[-1]
+        if record != DUPLICATE_GT_EXPECTED:
+            print(f"FAIL duplicate genotype strings ({engine}):\n  got      {record}\n  expected {DUPLICATE_GT_EXPECTED}")
+            ok = False
+    return ok
+
+
+def check_summary_truncated_samples(tmp):
+    path = os.path.join(tmp, "duplicate_gt.vcf")
+    summary = os.path.join(tmp, "duplicate_gt.summary.json")
+    with open(path, "w") as ofile:
+        ofile.write(DUPLICATE_GT_HEADER + "\n" + DUPLICATE_GT_RECORD + "\n")
+    subprocess.run([sys.executable, GENOTYPE_UNION, "--summary", summary, path, os.devnull], check=True)
+    with open(summary) as ifile:
+        sample_counts = json.load(ifile)["sample_counts"]
+    if sample_counts != DUPLICATE_GT_SAMPLE_COUNTS:
+        print(f"FAIL --summary of truncated samples:\n  got      {sample_counts}\n  expected {DUPLICATE_GT_SAMPLE_COUNTS}")
+        return False
+    return True
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sample-count scaling of genotype_union.py")
+    parser.add_argument("--samples", type=int, nargs="+", default=[100, 300, 1000, 3000, 10000], help="Samples per caller block")
+    parser.add_argument("--records", type=int, default=50, help="Number of records in each synthetic VCF")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeats per engine; the best time is reported")
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=list(ENGINES))
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        if not check_duplicate_genotype_strings(tmp) or not check_summary_truncated_samples(tmp):
+            sys.exit(1)
+        print("duplicate genotype strings and --summary of truncated samples: ok")
+        print("samples\tengine\tms_per_record\tus_per_record_per_sample")
+        for num_samples in args.samples:
+            path = os.path.join(tmp, f"merged.{num_samples}.vcf")
+            write_merged_vcf(path, num_samples, args.records)
+            for engine in args.engines:
+                elapsed, _ = time_engine(engine, path, args.repeat)
+                per_record = elapsed / args.records
+                print(f"{num_samples}\t{engine}\t{per_record * 1e3:.3f}\t{per_record / num_samples * 1e6:.3f}")
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+"""
+Time of the join key (UID) and VariantType construction of merge_annotations.py on a
+synthetic ANNOVAR / InterVar / snpEff annotation set (5M variants by default): the
+vectorized column operations against the previous row-wise DataFrame.apply. The keys
+and variant types are checked to be identical, and merge_annotations() is checked
+against the previous implementation on a --check-variants subset. Rows found only in
+ANNOVAR or only in InterVar, where the previous implementation failed, are checked to
+get a missing VariantType. merge_annotations.py is then run on a 4-chromosome set
+(12k variants by default, a fifth of them without an ANNOVAR row) as a whole and with
+--partition-by-chrom, and every output file checked to have the same rows.
+
+usage: benchmark_merge_annotations.py [--variants 5000000] [--legacy-variants N] [--check-variants 100000]
+                                      [--partition-variants 12000]
+"""
+
+import argparse
+import glob
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts")
+sys.path.insert(0, SCRIPTS)
+
+from merge_annotations import annovar_ids, classify_variant_type, classify_variant_types, merge_annotations, variant_ids  # noqa: E402
+
+CHROMS = np.array([str(i) for i in range(1, 23)] + ["X", "Y"], dtype=object)
+# (REF, ALT) pool: SNPs, insertions, deletions and DNP/TNP/ONP, weighted towards SNPs
+ALLELES = [("A", "G"), ("C", "T"), ("G", "A"), ("T", "C"), ("A", "C"), ("G", "T"),
+           ("A", "AT"), ("C", "CAG"), ("AT", "A"), ("CAGT", "C"), ("AC", "GT"), ("ACG", "TCA"), ("ACGT", "TGCA")]
+WEIGHTS = np.array([8, 8, 8, 8, 4, 4, 2, 2, 2, 2, 1, 1, 1], dtype=float)
+FUNCS = np.array(["exonic", "intronic", "intergenic", "UTR3", "ncRNA_exonic", "splicing", "upstream"], dtype=object)
+
+
+def synthetic_annotations(num_variants, seed=0):
+    """(annovar, intervar, snpeff) DataFrames describing the same variants."""
+    rng = np.random.default_rng(seed)
+    chrom = CHROMS[rng.integers(0, len(CHROMS), num_variants)]
+    pos = rng.integers(10000, 200000000, num_variants)
+    alleles = rng.choice(len(ALLELES), num_variants, p=WEIGHTS / WEIGHTS.sum())
+    ref = np.array([a[0] for a in ALLELES], dtype=object)[alleles]
+    alt = np.array([a[1] for a in ALLELES], dtype=object)[alleles]
+    deletion = np.array([len(a[0]) > len(a[1]) for a in ALLELES])[alleles]
+    # keyed on Start for deletions and on End otherwise, so every row joins
+    start = np.where(deletion, pos, pos - 1)
+    end = np.where(deletion, pos + 5, pos)
+
+    annovar = pd.DataFrame({
+        "Chr": "chr" + pd.Series(chrom), "Start": start, "End": end, "Ref": ref, "Alt": alt,
+        "Func.refGene": FUNCS[rng.integers(0, len(FUNCS), num_variants)],
+        "gnomAD_genomes_AF": rng.random(num_variants),
+    })
+    intervar = pd.DataFrame({
+        "#Chr": chrom, "Start": start, "End": end, "Ref": ref, "Alt": alt,
+        "InterVar.significance": np.array(["Benign", "Likely benign", "Uncertain significance"], dtype=object)[rng.integers(0, 3, num_variants)],
+        "InterVar.PVS1": rng.integers(0, 2, num_variants),
+    })
+    snpeff = pd.DataFrame({
+        "CHROM": "chr" + pd.Series(chrom), "POS": pd.Series(pos).astype(str), "ID": ".", "REF": ref, "ALT": alt,
+        "QUAL": "50", "FILTER": "PASS", "set": "HC-DV",
+        "highest_impact": np.array(["MODIFIER", "LOW", "MODERATE", "HIGH"], dtype=object)[rng.integers(0, 4, num_variants)],
+    })
+    return annovar, intervar, snpeff
+
+
+def legacy_annovar_id(row):
+    if len(row['Ref']) > len(row['Alt']):
+        return f"{row['Chr']}_{row['Start']}_{row['Ref']}_{row['Alt']}"
+    else:
+        return f"{row['Chr']}_{row['End']}_{row['Ref']}_{row['Alt']}"
+
+
+def legacy_snpeff_id(row):
+    return f"{row['CHROM']}_{row['POS']}_{row['REF']}_{row['ALT']}"
+
+
+def legacy_keys(annovar, intervar, snpeff):
+    """Row-wise UIDs and VariantType, as merge_annotations built them before."""
+    intervar = intervar.copy()
+    intervar['Chr'] = intervar['#Chr'].apply(lambda x: "chr" + str(x))
+    intervar.drop(columns=['#Chr'], inplace=True)
+    return (
+        annovar.apply(legacy_annovar_id, axis=1),
+        intervar.apply(legacy_annovar_id, axis=1),
+        snpeff.apply(legacy_snpeff_id, axis=1),
+        snpeff.apply(lambda row: classify_variant_type(row['REF'], row['ALT']), axis=1),
+    )
+
+
+def vectorized_keys(annovar, intervar, snpeff):
+    intervar = intervar.copy()
+    intervar['Chr'] = "chr" + intervar['#Chr'].astype(str)
+    intervar.drop(columns=['#Chr'], inplace=True)
+    return (
+        annovar_ids(annovar),
+        annovar_ids(intervar),
+        variant_ids(snpeff['CHROM'], snpeff['POS'], snpeff['REF'], snpeff['ALT']),
+        pd.Series(classify_variant_types(snpeff['REF'], snpeff['ALT']), index=snpeff.index),
+    )
+
+
+def legacy_merge_annotations(annovar, intervar, snpeff):
+    annovar['UID'] = annovar.apply(legacy_annovar_id, axis=1)
+    intervar['Chr'] = intervar['#Chr'].apply(lambda x: "chr" + str(x))
+    intervar.drop(columns=['#Chr'], inplace=True)
+    intervar['UID'] = intervar.apply(legacy_annovar_id, axis=1)
+    merged = pd.merge(intervar[['UID', 'InterVar.significance', 'InterVar.PVS1']], annovar, on='UID', how='outer')
+    merged.drop(columns=['Chr', 'Start', 'End', 'Ref', 'Alt'], inplace=True)
+    snpeff['UID'] = snpeff.apply(legacy_snpeff_id, axis=1)
+    merged = snpeff.merge(merged, how='outer', on='UID')
+    merged.drop('UID', axis=1, inplace=True)
+    variant_type = merged.apply(lambda row: classify_variant_type(row['REF'], row['ALT']), axis=1)
+    merged.insert(8, 'VariantType', variant_type)
+    return merged
+
+
+def check_unmatched_rows(annovar, intervar, snpeff):
+    """An ANNOVAR-only and an InterVar-only variant have no snpEff REF/ALT after the
+    outer merges: their VariantType must be missing, the others' unchanged.
+    """
+    annovar = annovar.head(3).copy()
+    intervar = intervar.head(3).copy()
+    snpeff = snpeff.head(3).copy()
+    annovar.loc[0, 'Start'] += 1
+    annovar.loc[0, 'End'] += 1
+    intervar.loc[1, 'Start'] += 1
+    intervar.loc[1, 'End'] += 1
+    expected = list(classify_variant_types(snpeff['REF'], snpeff['ALT']))
+    variant_types = merge_annotations(annovar, intervar, snpeff)['VariantType']
+    if len(variant_types) != 5 or variant_types.isna().sum() != 2 or sorted(variant_types.dropna()) != sorted(expected):
+        sys.exit(f"ERROR: VariantType of unmatched rows: {list(variant_types)}")
+
+
+def check_partitioned_merge(num_variants, chroms=4, chunk_rows=1000):
+    """merge_annotations.py and --partition-by-chrom must write the same rows to every
+    output file, also when ANNOVAR lacks some snpEff variants and has integer columns
+    (Otherinfo2/3), which an outer merge of inferred int64 columns would write as floats.
+    """
+    annovar, intervar, snpeff = synthetic_annotations(num_variants * len(CHROMS) // chroms)
+    order = pd.Series(range(chroms), index=CHROMS[:chroms])
+    rank = order.reindex(intervar["#Chr"]).to_numpy()
+    keep = ~np.isnan(rank)
+    rows = np.lexsort((intervar["End"].to_numpy()[keep], rank[keep]))
+    annovar, intervar, snpeff = (frame[keep].iloc[rows].reset_index(drop=True) for frame in (annovar, intervar, snpeff))
+    rng = np.random.default_rng(1)
+    annovar["Otherinfo1"] = "het"
+    annovar["Otherinfo2"] = rng.integers(10, 60, len(annovar))
+    annovar["Otherinfo3"] = rng.integers(10, 60, len(annovar))
+    intervar["InterVar.PVS1"] = intervar["InterVar.PVS1"].astype(float)
+    # every fifth snpEff variant has no ANNOVAR row
+    annovar = annovar[annovar.index % 5 != 0]
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs = []
+        for name, frame in (("annovar", annovar), ("intervar", intervar), ("snpeff", snpeff)):
+            inputs += [f"--{name}", os.path.join(tmp, f"{name}.tsv")]
+            frame.to_csv(inputs[-1], sep="\t", index=False)
+        outputs = {}
+        for mode, options in (("whole", []), ("partitioned", ["--partition-by-chrom", "--chunk-rows", str(chunk_rows)])):
+            odir = os.path.join(tmp, mode)
+            os.makedirs(odir)
+            subprocess.run([sys.executable, os.path.join(SCRIPTS, "merge_annotations.py"), "--name", "s", "-odir", odir] + inputs + options, check=True)
+            outputs[mode] = {}
+            for path in sorted(glob.glob(os.path.join(odir, "*.tsv"))):
+                with open(path) as lines:
+                    outputs[mode][os.path.basename(path)] = [next(lines)] + sorted(lines)
+    if outputs["whole"] != outputs["partitioned"]:
+        differing = [name for name in outputs["whole"] if outputs["whole"][name] != outputs["partitioned"].get(name)]
+        sys.exit(f"ERROR: --partition-by-chrom output differs: {differing}")
+    print(f"{len(snpeff)} variants on {chroms} chromosomes, {len(snpeff) - len(annovar)} without ANNOVAR rows: "
+          "whole-file and --partition-by-chrom outputs have the same rows")
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark merge_annotations.py key construction")
+    parser.add_argument("--variants", type=int, default=5000000, help="Variants in the synthetic annotation set")
+    parser.add_argument("--legacy-variants", type=int, default=None, help="Time the row-wise apply on the first N variants only (default: all)")
+    parser.add_argument("--check-variants", type=int, default=100000, help="Variants on which the full merge_annotations output is compared")
+    parser.add_argument("--partition-variants", type=int, default=12000, help="Variants of the whole-file against --partition-by-chrom check")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    annovar, intervar, snpeff = synthetic_annotations(args.variants)
+
+    elapsed, vectorized = timed(vectorized_keys, annovar, intervar, snpeff)
+    print(f"vectorized {args.variants:>10,} variants {elapsed:8.2f} s  {args.variants / elapsed:12,.0f} variants/sec")
+
+    legacy_variants = min(args.legacy_variants or args.variants, args.variants)
+    elapsed, legacy = timed(legacy_keys, annovar.head(legacy_variants), intervar.head(legacy_variants), snpeff.head(legacy_variants))
+    print(f"apply      {legacy_variants:>10,} variants {elapsed:8.2f} s  {legacy_variants / elapsed:12,.0f} variants/sec")
+    for name, new, old in zip(["annovar UID", "intervar UID", "snpeff UID", "VariantType"], vectorized, legacy):
+        if not new.head(legacy_variants).astype(object).equals(old.astype(object)):
+            sys.exit(f"ERROR: {name} differs")
+
+    check = [frame.head(args.check_variants).copy() for frame in (annovar, intervar, snpeff)]
+    expected = legacy_merge_annotations(*[frame.copy() for frame in check])
+    result = merge_annotations(*check)
+    if not result.astype(object).equals(expected.astype(object)):
+        sys.exit("ERROR: merge_annotations output differs")
+    check_unmatched_rows(annovar, intervar, snpeff)
+    print("keys, variant types and merged output agree, unmatched ANNOVAR/InterVar rows have no VariantType")
+    check_partitioned_merge(args.partition_variants)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+"""
+Wall time of bamfile_extract_nonprimary_reads.py with --processes 2, 4 and 8 against
+the default run (a serial full scan) on a synthetic coordinate-sorted BAM (1M read pairs
+over 50 Mb of each contig by default, with 1% each of supplementary and secondary
+alignments and single-end reads). The qname_rg_map.tsv and counts of every run are
+checked to be identical to the default run, and its non_primary.bam to have the same
+header and reads (BGZF block boundaries differ between the concatenated shards). Times
+depend on the CPUs of the host, printed with the results.
+
+usage: benchmark_parallel_extract.py [--pairs 1000000] [--span 50000000] [--processes 2 4 8]
+"""
+
+import argparse
+import filecmp
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pysam
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts")
+sys.path.insert(0, SCRIPTS)
+
+from synthetic_bam import EXTRA_CLASSES, PAIR_CLASSES, write_bam  # noqa: E402
+
+
+def all_classes(share=0.01):
+    pair_classes = dict(PAIR_CLASSES)
+    for extra_class in EXTRA_CLASSES:
+        pair_classes["primary"] -= share
+        pair_classes[extra_class] = share
+    return pair_classes
+
+
+def extract(original, odir, options):
+    os.makedirs(odir)
+    start = time.perf_counter()
+    with open(os.path.join(odir, "counts.tsv"), "w") as counts:
+        subprocess.run([sys.executable, os.path.join(SCRIPTS, "bamfile_extract_nonprimary_reads.py"),
+                        "--original_bam_path", original, "-odir", odir] + options, stdout=counts, check=True)
+    return time.perf_counter() - start
+
+
+def bam_contents(path):
+    with pysam.AlignmentFile(path) as bam:
+        return str(bam.header), [read.to_string() for read in bam.fetch(until_eof=True)]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark --processes of the non-primary read extraction")
+    parser.add_argument("--pairs", type=int, default=1000000, help="Read pairs in the synthetic BAM")
+    parser.add_argument("--span", type=int, default=50000000, help="Bases of each contig the reads are drawn from")
+    parser.add_argument("--processes", type=int, nargs="+", default=[2, 4, 8], help="Process counts to time against the default run")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        original = os.path.join(tmp, "sample.bam")
+        write_bam(original, args.pairs, sample_span=args.span, pair_classes=all_classes())
+        print(f"{os.path.getsize(original) / 1e6:.0f} MB BAM, {os.cpu_count()} CPUs")
+        default = os.path.join(tmp, "default")
+        default_seconds = extract(original, default, [])
+        print(f"default       {default_seconds:7.1f} s")
+        expected = bam_contents(os.path.join(default, "sample.non_primary.bam"))
+        for processes in args.processes:
+            odir = os.path.join(tmp, f"processes_{processes}")
+            seconds = extract(original, odir, ["--processes", str(processes)])
+            print(f"processes {processes:2d}  {seconds:7.1f} s  {default_seconds / seconds:5.2f}x the default run")
+            for output in ("sample.qname_rg_map.tsv", "counts.tsv"):
+                if not filecmp.cmp(os.path.join(default, output), os.path.join(odir, output), shallow=False):
+                    sys.exit(f"ERROR: processes {processes} {output} differs")
+            if bam_contents(os.path.join(odir, "sample.non_primary.bam")) != expected:
+                sys.exit(f"ERROR: processes {processes} non_primary.bam differs")
+        print("outputs agree")
+
+
+if __name__ == "__main__":
+    main()
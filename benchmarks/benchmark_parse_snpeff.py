@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+
+"""
+Peak RSS and lines/sec of parse_snpeff.py on a synthetic bcftools query TSV: the
+streaming summarize_ann path against the previous readlines + SnpEffField loop
+(reproduced here with the SnpEffField and SnpEffANNSubField classes it used). Each run is a
+separate process so ru_maxrss is its own peak. The outputs are checked to agree;
+SnpEffGene is compared as a set, since the old loop joined genes in set order.
+
+usage: benchmark_parse_snpeff.py [--records 200000] [--max-transcripts 12]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts")
+sys.path.insert(0, SCRIPTS)
+
+from synthetic_vcf import write_snpeff_query  # noqa: E402
+
+IMPLEMENTATIONS = ("readlines", "stream")
+
+
+# parse_snpeff.py's classes before the streaming rewrite, unchanged
+class SnpEffANNSubField:
+    """Parsed data of a single SnpEff ANN entry
+    Details for each sub-field can be found in SnpEff documentation
+    https://pcingola.github.io/SnpEff/se_inputoutput/ 
+    """
+    def __init__(self, annotation_subfield):
+        self.raw_annotation = annotation_subfield.strip('ANN=')
+
+
+        split_annotaion = self.raw_annotation.split('|')
+        self.allele = split_annotaion[0].strip('ANN=')
+        self.annotation = split_annotaion[1]
+        self.putative_impact = split_annotaion[2]
+        self.gene_name = split_annotaion[3]
+        self.gene_id = split_annotaion[4]
+        self.feature_type = split_annotaion[5]
+        self.feature_id = split_annotaion[6]
+        self.transcript_biotype = split_annotaion[7]
+        self.rank__total = split_annotaion[8]
+        self.hgvs_c = split_annotaion[9]
+        self.hgvs_p = split_annotaion[10]
+        self.cdna_position__cdna_length = split_annotaion[11]
+        self.cds_position__cds_length = split_annotaion[12]
+        self.protein_position__protein_length = split_annotaion[13]
+        self.distance_to_feature = split_annotaion[14]
+        self.errors = split_annotaion[15]
+
+    def __repr__(self) -> str:
+        return self.raw_annotation
+    def __str__(self) -> str:
+        return self.raw_annotation
+    
+    def is_high_impact(self):
+        return self.putative_impact in ('MODERATE', 'HIGH')
+
+
+class SnpEffField:
+    def __init__(self, annotation):
+        self.annotation = annotation.strip('ANN=')
+        split_annotation = self.annotation.split(',')
+        self.subfield_dict = defaultdict(list)
+        for annot in split_annotation:
+            subfield = SnpEffANNSubField(annot)
+            self.subfield_dict[subfield.putative_impact].append(subfield)
+        # self.subfields = [SnpEffANNSubField(x) for x in split_annotation]
+        self.highest_impact = self.find_highest_impact()
+    
+    def __repr__(self) -> str:
+        return self.annotation
+
+    @property
+    def gene(self):
+        gene_set = set([subfield.gene_name for subfield in self.subfield_dict[self.highest_impact] if subfield.gene_name != ''])
+        return ';'.join(gene_set)
+    
+    def find_highest_impact(self):
+        impact_levels = {'MODIFIER': 0, 'LOW': 1, 'MODERATE': 2, 'HIGH': 3}
+        current_impact_level = 'MODIFIER'
+        for impact in self.subfield_dict.keys():
+            if impact_levels[impact] > impact_levels[current_impact_level]:
+                current_impact_level = impact
+        return current_impact_level
+    
+    @property
+    def hgvs_c(self):
+        
+        hgvs_c = [subfield.hgvs_c for subfield in self.subfield_dict[self.highest_impact] if subfield.hgvs_c != '']
+        
+        if len(hgvs_c) > 0:
+            return ';'.join(hgvs_c)
+        else:
+            return '.'
+    
+    @property
+    def hgvs_p(self):
+        hgvs_p = [subfield.hgvs_p for subfield in self.subfield_dict[self.highest_impact] if subfield.hgvs_p != '']
+        if len(hgvs_p) > 0:
+            return ';'.join(hgvs_p)
+        else:
+            return '.'
+    
+    @property
+    def effect(self):
+        effect = [subfield.annotation for subfield in self.subfield_dict[self.highest_impact]]
+        effect = list(set(effect))
+        effect.sort()
+        if len(effect) > 0:
+            return ';'.join(effect)
+        else:
+            return '.'
+
+        
+    @property
+    def num_impact_transcripts(self):
+        return len(self.subfield_dict[self.highest_impact])
+        # total = 0
+        # for sub in self.subfields:
+        #     if sub.is_high_impact():
+        #         total = total + 1
+        # return total
+    
+    @property
+    def is_classic_high_impact(self):      
+        classic_high_impact_classifications = ['frameshift_variant', 'stop_gained','stop_lost','start_lost','splice_acceptor_variant','splice_donor_variant']
+        if self.highest_impact == 'HIGH' and any(x in self.effect for x in classic_high_impact_classifications):
+            return 'Y'
+        return 'N'
+        
+
+    @property
+    def total_transcripts(self):
+        total = 0
+        for impact, transcripts in self.subfield_dict.items():
+            total = total + len(transcripts)
+        return total
+
+
+def readlines_parse_snpEff(infile, outfile, include_header, write_unannotated):
+    """parse_snpEff before streaming: whole file in memory, one SnpEffField per line."""
+    from parse_snpeff import OUTPUT_HEADER
+
+    with open(infile) as ifile, open(outfile, "w") as ofile:
+        if include_header:
+            ofile.write(OUTPUT_HEADER)
+        for line in ifile.readlines():
+            if line.startswith("#"):
+                continue
+            chrom, pos, id, ref, alt, qual, filt, set, ann = line.strip("\n").split("\t")
+            if ann != ".":
+                ann = SnpEffField(ann)
+                ofile.write(f"{chrom}\t{pos}\t{id}\t{ref}\t{alt}\t{qual}\t{filt}\t{set}\t{ann}\t{ann.highest_impact}\t{ann.num_impact_transcripts}\t{ann.total_transcripts}\t{ann.hgvs_c}\t{ann.hgvs_p}\t{ann.effect}\t{ann.gene}\n")
+            elif write_unannotated:
+                ofile.write(f"{chrom}\t{pos}\t{id}\t{ref}\t{alt}\t{qual}\t{filt}\t{set}" + ("\t." * 8) + "\n")
+
+
+def child(implementation, infile, outfile):
+    """Run one implementation in this process and print its time and peak RSS as JSON."""
+    from parse_snpeff import parse_snpEff
+
+    function = readlines_parse_snpEff if implementation == "readlines" else parse_snpEff
+    start = time.perf_counter()
+    function(infile, outfile, True, True)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    print(json.dumps({"seconds": elapsed, "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+
+
+def normalized(path):
+    rows = []
+    with open(path) as ifile:
+        for line in ifile:
+            fields = line.rstrip("\n").split("\t")
+            fields[-1] = ";".join(sorted(fields[-1].split(";")))
+            rows.append(fields)
+    return rows
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark parse_snpeff.py peak memory and throughput")
+    parser.add_argument("--records", type=int, default=200000, help="Records in the synthetic query TSV")
+    parser.add_argument("--max-transcripts", type=int, default=12, help="Maximum ANN entries per record")
+    parser.add_argument("--child", nargs=3, metavar=("IMPL", "IN", "OUT"), help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        infile = os.path.join(tmp, "snpeff.tsv")
+        write_snpeff_query(infile, args.records, args.max_transcripts)
+        size_mb = os.path.getsize(infile) / 1e6
+        print(f"{args.records} records, {size_mb:.1f} MB")
+        outputs = {}
+        for implementation in IMPLEMENTATIONS:
+            outfile = os.path.join(tmp, implementation + ".tsv")
+            result = json.loads(subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", implementation, infile, outfile],
+                stdout=subprocess.PIPE, check=True,
+            ).stdout)
+            outputs[implementation] = outfile
+            print(f"{implementation:10s} {args.records / result['seconds']:12,.0f} lines/sec  peak RSS {result['max_rss_mb']:8.1f} MB")
+        if normalized(outputs["readlines"]) != normalized(outputs["stream"]):
+            sys.exit("ERROR: outputs differ")
+        print("outputs agree")
+
+
+if __name__ == "__main__":
+    main()
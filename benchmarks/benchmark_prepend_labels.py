@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+"""
+Lines/sec of prepend_labels.py against the awk prepend_labels_stdin.sh on a
+synthetic single caller VCF (1,000 samples by default). Every prepend_labels.py
+run is checked to be byte-identical to the awk output.
+
+usage: benchmark_prepend_labels.py [--samples 1000] [--records 2000] [--threads 1 4]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts")
+sys.path.insert(0, SCRIPTS)
+
+from synthetic_vcf import CALLER_KEYS, write_caller_vcf  # noqa: E402
+
+
+def run(command, path, repeat):
+    best = None
+    output = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with open(path, "rb") as in_handle:
+            output = subprocess.run(command, stdin=in_handle, stdout=subprocess.PIPE, check=True).stdout
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, output
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark prepend_labels.py against prepend_labels_stdin.sh")
+    parser.add_argument("--samples", type=int, default=1000, help="Samples in the synthetic VCF")
+    parser.add_argument("--records", type=int, default=2000, help="Number of records in the synthetic VCF")
+    parser.add_argument("--caller", default="DV", choices=list(CALLER_KEYS))
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4], help="prepend_labels.py --threads values to time")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeats per command; the best time is reported")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    awk = ["bash", os.path.join(SCRIPTS, "prepend_labels_stdin.sh"), args.caller]
+    python = [sys.executable, os.path.join(SCRIPTS, "prepend_labels.py"), args.caller]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"{args.caller}.{args.samples}.vcf")
+        write_caller_vcf(path, args.caller, args.samples, args.records)
+        mb = os.path.getsize(path) / 1e6
+        print("command\tthreads\tseconds\tlines_per_sec\tMB_per_sec\tspeedup\tidentical")
+        reference_time, reference = run(awk, path, args.repeat)
+        print(f"prepend_labels_stdin.sh\t1\t{reference_time:.3f}\t{args.records / reference_time:,.0f}\t{mb / reference_time:.1f}\t1.00x\tTrue")
+        for threads in args.threads:
+            elapsed, output = run(python + ["--threads", str(threads)], path, args.repeat)
+            print(
+                f"prepend_labels.py\t{threads}\t{elapsed:.3f}\t{args.records / elapsed:,.0f}\t{mb / elapsed:.1f}"
+                f"\t{reference_time / elapsed:.2f}x\t{output == reference}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+"""
+Synthetic BAM generator used by the BAM patch tool benchmarks: coordinate-sorted,
+indexed paired-end 151 bp reads over GRCh38-style primary, chrM, alt, decoy and HLA
+contigs, with a share of pairs split across contigs and an unmapped tail, and on request
+supplementary and secondary alignments and single-end reads.
+"""
+
+import random
+
+import pysam
+
+PRIMARY_CONTIGS = [(f"chr{i}", length) for i, length in zip(range(1, 23), [
+    248956422, 242193529, 198295559, 190214555, 181538259, 170805979, 159345973, 145138636, 138394717, 133797422, 135086622,
+    133275309, 114364328, 107043718, 101991189, 90338345, 83257441, 80373285, 58617616, 64444167, 46709983, 50818468,
+])] + [("chrX", 156040895), ("chrY", 57227415)]
+OTHER_CONTIGS = [
+    ("chrM", 16569), ("chr1_KI270706v1_random", 175055), ("chr6_GL000250v2_alt", 4672374), ("chrUn_KI270742v1", 186739),
+    ("chrEBV", 171823), ("HLA-A*01:01:01:01", 3503), ("HLA-DRB1*15:01:01:01", 11080),
+]
+CONTIGS = PRIMARY_CONTIGS + OTHER_CONTIGS
+READ_LENGTH = 151
+# pair classes and their share of the pairs
+PAIR_CLASSES = {"primary": 0.94, "other": 0.03, "split": 0.01, "mate_unmapped": 0.01, "unmapped": 0.01}
+# classes only written when given a share in pair_classes: split pairs with a supplementary
+# (with SA tags) or secondary alignment of one mate on a primary chromosome, and
+# unpaired reads on a primary chromosome
+EXTRA_CLASSES = ("supplementary", "secondary", "single_end")
+
+
+def illumina_qname(i):
+    """Unique Illumina-style read name of pair i."""
+    return f"A00123:456:HVWJKDSXY:{i % 4 + 1}:{1101 + i // 4000000 % 78}:{i // 4000 % 1000 + 1000}:{i % 4000 * 9 + 1000}"
+
+
+def pair_alignments(rng, num_pairs, sample_span, pair_classes=PAIR_CLASSES):
+    """Yield (qname, rg index, [(tid, pos, unmapped) of mate 1, of mate 2], [(mate, tid, pos, flag)
+    of the supplementary or secondary alignments]) per pair. Single-end reads have one mate.
+    """
+    primary = range(len(PRIMARY_CONTIGS))
+    other = range(len(PRIMARY_CONTIGS), len(CONTIGS))
+    classes = list(pair_classes)
+    weights = list(pair_classes.values())
+
+    def position(tid):
+        return rng.randrange(0, min(CONTIGS[tid][1], sample_span) - READ_LENGTH)
+
+    for i in range(num_pairs):
+        qname = illumina_qname(i)
+        pair_class = rng.choices(classes, weights)[0]
+        extra = []
+        if pair_class == "primary":
+            tid = rng.choice(primary)
+            pos = position(tid)
+            mates = [(tid, pos, False), (tid, pos + rng.randrange(0, 400), False)]
+        elif pair_class == "other":
+            tid = rng.choice(other)
+            pos = position(tid)
+            mates = [(tid, pos, False), (tid, min(pos + rng.randrange(0, 400), CONTIGS[tid][1] - READ_LENGTH), False)]
+        elif pair_class == "split":
+            tid = rng.choice(primary)
+            mates = [(tid, position(tid), False)]
+            tid = rng.choice(other)
+            mates.append((tid, position(tid), False))
+            rng.shuffle(mates)
+        elif pair_class == "mate_unmapped":
+            tid = rng.choice(primary)
+            pos = position(tid)
+            mates = [(tid, pos, False), (tid, pos, True)]
+        elif pair_class in ("supplementary", "secondary"):
+            tid = rng.choice(primary)
+            mates = [(tid, position(tid), False)]
+            tid = rng.choice(other)
+            mates.append((tid, position(tid), False))
+            rng.shuffle(mates)
+            tid = rng.choice(primary)
+            extra.append((rng.randrange(2), tid, position(tid), 0x800 if pair_class == "supplementary" else 0x100))
+        elif pair_class == "single_end":
+            tid = rng.choice(primary)
+            mates = [(tid, position(tid), False)]
+        else:
+            mates = [(-1, -1, True), (-1, -1, True)]
+        yield qname, i % 2, mates, extra
+
+
+def sa_tag(alignments):
+    """SA tag value listing (tid, pos) alignments."""
+    return "".join(f"{CONTIGS[tid][0]},{pos + 1},+,{READ_LENGTH}M,60,0;" for tid, pos in alignments)
+
+
+def write_bam(path, num_pairs, seed=0, num_read_groups=2, sample_span=2000000, index=True, pair_classes=PAIR_CLASSES):
+    """Write a coordinate-sorted synthetic BAM of num_pairs read pairs (and its .bai).
+
+    sample_span caps the positions drawn on each contig, so small BAMs still have
+    reads on every contig. pair_classes overrides the PAIR_CLASSES shares.
+    """
+    rng = random.Random(seed)
+    read_groups = [f"HVWJKDSXY.{i + 1}" for i in range(num_read_groups)]
+    header = {
+        "HD": {"VN": "1.6", "SO": "coordinate"},
+        "SQ": [{"SN": name, "LN": length} for name, length in CONTIGS],
+        "RG": [{"ID": rg, "SM": "SAMPLE1", "LB": "LIB1", "PL": "ILLUMINA", "PU": rg} for rg in read_groups],
+        "PG": [{"ID": "bwa", "PN": "bwa", "VN": "0.7.17"}],
+    }
+    sequences = ["".join(rng.choice("ACGT") for _ in range(READ_LENGTH)) for _ in range(64)]
+    qualities = pysam.qualitystring_to_array("F" * READ_LENGTH)
+
+    records = []
+    for qname, rg, mates, extra in pair_alignments(rng, num_pairs, sample_span, pair_classes):
+        paired = len(mates) == 2
+        supplementary = {mate: (tid, pos) for mate, tid, pos, flag in extra if flag == 0x800}
+        alignments = [(mate, tid, pos, unmapped, 0) for mate, (tid, pos, unmapped) in enumerate(mates)]
+        alignments += [(mate, tid, pos, False, flag) for mate, tid, pos, flag in extra]
+        for mate, tid, pos, unmapped, flag in alignments:
+            mate_tid, mate_pos, mate_unmapped = mates[1 - mate] if paired else (-1, -1, False)
+            if unmapped and tid == -1 and mate_tid != -1:
+                tid, pos = mate_tid, mate_pos
+            if mate_unmapped and mate_tid == -1 and tid != -1:
+                mate_tid, mate_pos = tid, pos
+            # primary and supplementary alignments of a read list each other in their SA tags
+            sa = None
+            if mate in supplementary and flag != 0x100:
+                sa = sa_tag([supplementary[mate]] if flag == 0 else [mates[mate][:2]])
+            records.append((tid if tid >= 0 else len(CONTIGS), pos, qname, mate, flag, rg, tid, pos, unmapped, paired,
+                            mate_tid, mate_pos, mate_unmapped, sa))
+    records.sort(key=lambda record: record[:5])
+
+    with pysam.AlignmentFile(path, "wb", header=header) as bam:
+        for _, _, qname, mate, flag, rg, tid, pos, unmapped, paired, mate_tid, mate_pos, mate_unmapped, sa in records:
+            read = pysam.AlignedSegment(bam.header)
+            read.query_name = qname
+            if paired:
+                flag |= 0x1 | (0x40 if mate == 0 else 0x80) | (0x8 if mate_unmapped else 0)
+            read.flag = flag | (0x4 if unmapped else 0)
+            read.reference_id = tid
+            read.reference_start = pos
+            read.next_reference_id = mate_tid
+            read.next_reference_start = mate_pos
+            read.query_sequence = rng.choice(sequences)
+            read.query_qualities = qualities
+            if not unmapped:
+                read.mapping_quality = 60
+                read.cigarstring = f"{READ_LENGTH}M"
+                if paired and not mate_unmapped and tid == mate_tid:
+                    read.flag |= 0x2
+                    read.template_length = (mate_pos - pos + READ_LENGTH) if mate_pos >= pos else -(pos - mate_pos + READ_LENGTH)
+            tags = [("RG", read_groups[rg]), ("AS", rng.randrange(100, 152)), ("XS", rng.randrange(0, 100))]
+            read.set_tags(tags + [("SA", sa)] if sa is not None else tags)
+            bam.write(read)
+    if index:
+        pysam.index(path)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+"""
+Synthetic VCF generators used by the benchmark scripts.
+"""
+
+import random
+
+CALLERS = ("HC", "DV", "strelka2")
+CALLER_KEYS = {
+    "HC": ["GT", "AD", "DP", "GQ", "PL"],
+    "DV": ["GT", "AD", "DP", "GQ", "VAF", "PL"],
+    "strelka2": ["GT", "AD", "DP", "GQ"],
+}
+GENOTYPES = ["0/0", "0/1", "1/1", "1/0", "./.", "0/1", "0/0", "0/0", "0|1", "."]
+BASES = "ACGT"
+
+
+def random_value(rng, key, gt):
+    if key == "GT":
+        return gt
+    if gt == "./.":
+        return "."
+    if key in ("AD", "PL"):
+        return ",".join(str(rng.randint(0, 60)) for _ in range(2 if key == "AD" else 3))
+    if key == "VAF":
+        return f"{rng.random():.3f}"
+    return str(rng.randint(1, 99))
+
+
+def merged_vcf_lines(num_samples, num_records, seed=0):
+    """Yield lines of a `bcftools merge --force-samples` style VCF with
+    3 x num_samples genotype columns (HC, DV then strelka2 blocks).
+    """
+    rng = random.Random(seed)
+    samples = [f"SM{i:06d}" for i in range(num_samples)]
+    columns = samples + [f"2:{s}" for s in samples] + [f"3:{s}" for s in samples]
+    yield "##fileformat=VCFv4.2\n"
+    yield "##contig=<ID=chr1,length=248956422>\n"
+    yield '##FORMAT=<ID=GT,Number=1,Type=String,Description="Concordant Genotype">\n'
+    for caller in CALLERS:
+        yield f'##INFO=<ID={caller}_DP,Number=1,Type=Integer,Description="Depth">\n'
+        for key in CALLER_KEYS[caller]:
+            yield f'##FORMAT=<ID={caller}_{key},Number=.,Type=String,Description="{key}">\n'
+    yield "\t".join(["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT"] + columns) + "\n"
+
+    caller_sets = [c for n in range(1, 8) for c in [tuple(CALLERS[i] for i in range(3) if n >> i & 1)]]
+    pos = 10000
+    for _ in range(num_records):
+        pos += rng.randint(1, 200)
+        callers = rng.choice(caller_sets)
+        ref = rng.choice(BASES)
+        alt = rng.choice([b for b in BASES if b != ref])
+        if rng.random() < 0.2:
+            alt = alt + "".join(rng.choice(BASES) for _ in range(rng.randint(1, 4)))
+        keys = [(c, k) for c in callers for k in CALLER_KEYS[c]]
+        format_field = ":".join(["GT"] + [f"{c}_{k}" for c, k in keys])
+        info = ";".join(f"{c}_DP={rng.randint(10, 5000)}" for c in callers)
+        record = ["chr1", str(pos), f"chr1_{pos}_{ref}_{alt}", ref, alt, "30", "PASS", info, format_field]
+        for caller in CALLERS:
+            for _ in range(num_samples):
+                gt = rng.choice(GENOTYPES) if caller in callers else "./."
+                values = [gt]
+                for c, k in keys:
+                    values.append(random_value(rng, k, gt) if c == caller else ".")
+                record.append(":".join(values))
+        yield "\t".join(record) + "\n"
+
+
+def write_merged_vcf(path, num_samples, num_records, seed=0):
+    with open(path, "w") as ofile:
+        ofile.writelines(merged_vcf_lines(num_samples, num_records, seed))
+
+
+def caller_vcf_lines(caller, num_samples, num_records, seed=0):
+    """Yield lines of a normalized, unlabeled single caller VCF (the input of prepend_labels)."""
+    rng = random.Random(seed)
+    keys = CALLER_KEYS[caller]
+    yield "##fileformat=VCFv4.2\n"
+    yield "##contig=<ID=chr1,length=248956422>\n"
+    yield '##INFO=<ID=DP,Number=1,Type=Integer,Description="Depth">\n'
+    for key in keys:
+        yield f'##FORMAT=<ID={key},Number=.,Type=String,Description="{key}">\n'
+    samples = [f"SM{i:06d}" for i in range(num_samples)]
+    yield "\t".join(["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT"] + samples) + "\n"
+
+    pos = 10000
+    for _ in range(num_records):
+        pos += rng.randint(1, 200)
+        ref = rng.choice(BASES)
+        alt = rng.choice([b for b in BASES if b != ref])
+        record = ["chr1", str(pos), ".", ref, alt, str(rng.randint(1, 99)), "PASS", f"DP={rng.randint(10, 5000)}", ":".join(keys)]
+        for _ in range(num_samples):
+            gt = rng.choice(GENOTYPES)
+            record.append(":".join(random_value(rng, key, gt) for key in keys))
+        yield "\t".join(record) + "\n"
+
+
+def write_caller_vcf(path, caller, num_samples, num_records, seed=0):
+    with open(path, "w") as ofile:
+        ofile.writelines(caller_vcf_lines(caller, num_samples, num_records, seed))
+
+
+SNPEFF_EFFECTS = [
+    ("intron_variant", "MODIFIER"),
+    ("upstream_gene_variant", "MODIFIER"),
+    ("downstream_gene_variant", "MODIFIER"),
+    ("synonymous_variant", "LOW"),
+    ("splice_region_variant&intron_variant", "LOW"),
+    ("missense_variant", "MODERATE"),
+    ("stop_gained", "HIGH"),
+]
+
+
+def snpeff_query_lines(num_records, max_transcripts=12, seed=0):
+    """Yield lines of `bcftools query -f '%CHROM\\t%POS\\t%ID\\t%REF\\t%ALT\\t%QUAL\\t%FILTER\\t%INFO/set\\t%INFO/ANN\\n'`
+    (the input of parse_snpeff.py); about one record in ten is unannotated."""
+    rng = random.Random(seed)
+    pos = 10000
+    for _ in range(num_records):
+        pos += rng.randint(1, 200)
+        ref = rng.choice(BASES)
+        alt = rng.choice([b for b in BASES if b != ref])
+        fields = ["chr1", str(pos), ".", ref, alt, str(rng.randint(1, 99)), "PASS", rng.choice(CALLERS)]
+        if rng.random() < 0.1:
+            fields.append(".")
+        else:
+            entries = []
+            for t in range(rng.randint(1, max_transcripts)):
+                effect, impact = rng.choice(SNPEFF_EFFECTS)
+                gene = f"GENE{rng.randint(1, 3)}"
+                coding = impact in ("LOW", "MODERATE", "HIGH")
+                hgvs_c = f"c.{rng.randint(1, 3000)}{ref}>{alt}" if coding or rng.random() < 0.5 else ""
+                hgvs_p = f"p.Ala{rng.randint(1, 1000)}Thr" if coding else ""
+                entries.append("|".join([
+                    alt, effect, impact, gene, f"ENSG{rng.randint(0, 99999):011d}", "transcript",
+                    f"ENST{rng.randint(0, 99999):011d}.{t}", "protein_coding", f"{rng.randint(1, 20)}/20",
+                    hgvs_c, hgvs_p, "", "", "", str(rng.randint(0, 5000)) if not coding else "", "",
+                ]))
+            fields.append(",".join(entries))
+        yield "\t".join(fields) + "\n"
+
+
+def write_snpeff_query(path, num_records, max_transcripts=12, seed=0):
+    with open(path, "w") as ofile:
+        ofile.writelines(snpeff_query_lines(num_records, max_transcripts, seed))
+
+
+GNOMAD_AF = ["AF", "AF_raw", "AF_XX", "AF_XY", "AF_afr", "AF_ami", "AF_amr", "AF_asj", "AF_eas", "AF_fin", "AF_mid", "AF_nfe", "AF_oth", "AF_sas"]
+ANNOVAR_COLUMNS = (
+    ["Chr", "Start", "End", "Ref", "Alt", "Func.refGene", "Gene.refGene", "GeneDetail.refGene", "ExonicFunc.refGene", "AAChange.refGene"]
+    + GNOMAD_AF
+    + ["CLNALLELEID", "CLNDN", "CLNDISDB", "CLNREVSTAT", "CLNSIG", "cytoBand", "Otherinfo1", "Otherinfo2", "Otherinfo3"]
+)
+FUNC_REFGENE = ["exonic", "intronic", "intergenic", "UTR3", "ncRNA_exonic", "splicing", "upstream", "exonic;splicing"]
+INTERVAR_COLUMNS = [
+    "#Chr", "Start", "End", "Ref", "Alt", "Ref.Gene", "Func.refGene", "ExonicFunc.refGene", "Gene.ensGene", "avsnp147",
+    "AAChange.ensGene", "AAChange.refGene", " clinvar: Clinvar ", " InterVar: InterVar and Evidence ", "Freq_gnomAD_genome_ALL",
+    "Freq_esp6500siv2_all", "Freq_1000g2015aug_all", "CADD_raw", "CADD_phred", "SIFT_score", "GERP++_RS",
+    "phyloP46way_placental", "MetaSVM_score", "Interpro_domain", "dbscSNV_ADA_SCORE", "dbscSNV_RF_SCORE", "Orpha",
+    "OMIM", "Phenotype_MIM", "OrphaNumber", "Otherinfo",
+]
+SIGNIFICANCE = ["Benign", "Likely benign", "Uncertain significance", "Likely pathogenic", "Pathogenic"]
+
+
+def annovar_variants(rng, num_records):
+    """Yield (chrom, start, end, ref, alt) of sorted synthetic variants in ANNOVAR coordinates."""
+    pos = 10000
+    for _ in range(num_records):
+        pos += rng.randint(1, 200)
+        ref = rng.choice(BASES)
+        alt = rng.choice([b for b in BASES if b != ref])
+        yield "chr1", pos, pos, ref, alt
+
+
+def annovar_multianno_lines(num_records, seed=0):
+    """Yield lines of a table_annovar.pl multianno table (refGene, gnomad312_genome, clinvar, cytoBand)."""
+    rng = random.Random(seed)
+    yield "\t".join(ANNOVAR_COLUMNS) + "\n"
+    for chrom, start, end, ref, alt in annovar_variants(rng, num_records):
+        gene = f"GENE{rng.randint(1, 20000)}"
+        exonic = rng.random() < 0.3
+        afs = ["." if rng.random() < 0.2 else f"{rng.random() / 10:.4g}" for _ in GNOMAD_AF]
+        clinvar = [str(rng.randint(1, 10 ** 6)), "not_provided", "MedGen:CN517202", "criteria_provided,_single_submitter", "Benign"] if rng.random() < 0.1 else ["."] * 5
+        yield "\t".join(
+            [chrom, str(start), str(end), ref, alt, rng.choice(FUNC_REFGENE), gene, ".",
+             "nonsynonymous SNV" if exonic else ".",
+             f"{gene}:NM_{rng.randint(0, 999999):06d}:exon{rng.randint(1, 20)}:c.{rng.randint(1, 3000)}{ref}>{alt}:p.A{rng.randint(1, 1000)}T" if exonic else "."]
+            + afs + clinvar + [f"1p{rng.randint(11, 36)}.{rng.randint(1, 3)}", "het", str(rng.randint(10, 99)), str(rng.randint(5, 500))]
+        ) + "\n"
+
+
+def intervar_evidence(rng):
+    """InterVar: <significance> PVS1=.. PS=[..] PM=[..] PP=[..] BA1=.. BS=[..] BP=[..] (as Intervar.py writes it)."""
+    def codes(n):
+        return "[" + ", ".join("1" if rng.random() < 0.1 else "0" for _ in range(n)) + "]"
+    return "InterVar: {} PVS1={} PS={} PM={} PP={} BA1={} BS={} BP={} ".format(
+        rng.choice(SIGNIFICANCE), int(rng.random() < 0.05), codes(5), codes(7), codes(6), int(rng.random() < 0.05), codes(5), codes(8)
+    )
+
+
+def intervar_lines(num_records, seed=0):
+    """Yield lines of an Intervar.py .intervar table."""
+    rng = random.Random(seed)
+    yield "\t".join(INTERVAR_COLUMNS) + "\n"
+    for chrom, start, end, ref, alt in annovar_variants(rng, num_records):
+        gene = f"GENE{rng.randint(1, 20000)}"
+        fields = [chrom[3:], str(start), str(end), ref, alt, gene, rng.choice(FUNC_REFGENE), ".", f"ENSG{rng.randint(0, 99999):011d}",
+                  f"rs{rng.randint(1, 10 ** 8)}", ".", ".", "clinvar: UNK ", intervar_evidence(rng)]
+        fields += [f"{rng.random():.4g}" for _ in range(len(INTERVAR_COLUMNS) - len(fields) - 1)] + ["."]
+        yield "\t".join(fields) + "\n"
+
+
+def write_lines(path, lines):
+    with open(path, "w") as ofile:
+        ofile.writelines(lines)
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+"""
+Typed, column-pruned reading of the annotation tables (ANNOVAR multianno, InterVar and
+parse_intervar.py output) shared by merge_annotations.py and parse_intervar.py.
+"""
+
+import sys
+
+import numpy as np
+import pandas as pd
+
+CSV_ENGINES = ['c', 'pyarrow']
+
+
+def read_options(dtypes):
+    """read_csv keyword arguments reading only the dtypes columns; float columns take '.' as missing"""
+    return {
+        'usecols': list(dtypes),
+        'dtype': dtypes,
+        'na_values': {column: ['.'] for column, dtype in dtypes.items() if dtype == 'float64'},
+    }
+
+
+def read_table(filename, dtypes, engine='c'):
+    """Read the dtypes columns of a TSV with the c or pyarrow read_csv engine"""
+    if engine == 'c':
+        return pd.read_csv(filename, sep = '\t', **read_options(dtypes))
+    # the pyarrow engine takes no per column na_values and reads missing dtype=str values
+    # as 'nan': read text and float columns as pandas strings, then convert as the c engine
+    arrow_dtypes = {column: 'string' if dtype in (str, 'float64') else dtype for column, dtype in dtypes.items()}
+    try:
+        table = pd.read_csv(filename, sep = '\t', usecols=list(dtypes), dtype=arrow_dtypes, engine='pyarrow')
+    except ImportError:
+        sys.exit('ERROR: --csv-engine pyarrow requires pyarrow to be installed')
+    for column, dtype in dtypes.items():
+        if dtype in (str, 'float64'):
+            values = table[column].to_numpy(dtype=object, na_value=np.nan)
+            table[column] = pd.to_numeric(values, errors='coerce') if dtype == 'float64' else values
+    return table
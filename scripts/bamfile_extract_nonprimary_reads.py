@@ -4,15 +4,145 @@ import pysam
 import click
 import os
 import collections
+import contextlib
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 
 ALLOWED_CHROMOSOMES = {'chr' + str(i) for i in range(1, 23)}
 ALLOWED_CHROMOSOMES.update(['chrX', 'chrY'])
+# --processes work units: primary chromosomes are split into ranges of this many bases,
+# smaller consecutive contigs grouped up to it
+UNIT_BASES = 20000000
+
+def is_non_primary(read):
+    # the read is unmapped, or it or its mate is not on a primary chromosome
+    return read.is_unmapped or read.reference_name not in ALLOWED_CHROMOSOMES or read.next_reference_name not in ALLOWED_CHROMOSOMES
+
+def scan_non_primary_reads(bam_in):
+    """Non-primary reads of a BAM, in file order, from a scan of every read"""
+    for read in bam_in.fetch(until_eof=True):
+        if is_non_primary(read):
+            yield read
+
+def write_non_primary_reads(reads, bam_out, qname_rg_out, original_rg_tag, non_primary_counts, processed_recovered_qnames):
+    """Write non-primary reads, counting them per contig, with their RG in original_rg_tag
+    or the first RG of each QNAME to qname_rg_out
+    """
+    for read in reads:
+        # Process each read: it or its mate is not mapped to a primary chromosome
+        read_chrom = read.reference_name
+        non_primary_counts[read_chrom] = non_primary_counts[read_chrom] + 1
+        if original_rg_tag is not None:
+            # the RG travels with the read, no QNAME map (or QNAME set) needed
+            read.set_tag(original_rg_tag, read.get_tag('RG'), value_type='Z')
+        elif read.query_name not in processed_recovered_qnames:
+            processed_recovered_qnames.add(read.query_name)
+            qname_rg_out.write(f'{read.query_name}\t{read.get_tag("RG")}\n')
+        bam_out.write(read)
+
+def extraction_units(bam_in, unit_bases=UNIT_BASES):
+    """Work units of the --processes pool, in file order: lists of (contig, start, end)
+    ranges of about unit_bases, then the unmapped tail ('*') on its own
+    """
+    units = []
+    unit = []
+    unit_length = 0
+    for contig, length in zip(bam_in.references, bam_in.lengths):
+        for start in range(0, length, unit_bases):
+            end = min(start + unit_bases, length)
+            unit.append((contig, start, end))
+            unit_length += end - start
+            if unit_length >= unit_bases:
+                units.append(unit)
+                unit = []
+                unit_length = 0
+    if unit:
+        units.append(unit)
+    units.append([('*', None, None)])
+    return units
+
+def unit_non_primary_reads(bam_in, ranges):
+    """Non-primary reads starting in the ranges of a work unit, in file order"""
+    for contig, start, end in ranges:
+        if contig == '*':
+            yield from bam_in.fetch('*')
+            continue
+        for read in bam_in.fetch(contig, start, end):
+            # reads starting before the range belong to the previous one
+            if read.reference_start >= start and is_non_primary(read):
+                yield read
+
+# input BAM of the worker processes of the --processes pool
+_worker_bam = None
+
+def _init_worker(original_bam_path, threads):
+    global _worker_bam
+    _worker_bam = pysam.AlignmentFile(original_bam_path, "rb", threads=threads)
+
+def extract_unit(unit_index, ranges, shard_prefix, original_rg_tag, format_options, threads):
+    """Worker task: write the non-primary reads of a work unit to a shard BAM (and a shard
+    QNAME map without header). Returns the shard paths and the unit's per-contig counts.
+    """
+    shard_bam_path = f'{shard_prefix}.{unit_index:05d}.bam'
+    shard_map_path = f'{shard_prefix}.{unit_index:05d}.tsv' if original_rg_tag is None else None
+    non_primary_counts = collections.defaultdict(int)
+    qname_rg_file = open(shard_map_path, 'w') if shard_map_path is not None else contextlib.nullcontext()
+    with pysam.AlignmentFile(shard_bam_path, "wb", header=_worker_bam.header, threads=threads, format_options=format_options) as bam_out, qname_rg_file as qname_rg_out:
+        write_non_primary_reads(unit_non_primary_reads(_worker_bam, ranges), bam_out, qname_rg_out, original_rg_tag, non_primary_counts, set())
+    return shard_bam_path, shard_map_path, list(non_primary_counts.items())
+
+def parallel_extract(original_bam_path, output_bam_path, qname_rg_out, original_rg_tag, format_options, threads, processes,
+                     non_primary_counts, processed_recovered_qnames):
+    """Extract the work units in a process pool, then concatenate the shards in unit order,
+    so the output is the same as a serial scan
+    """
+    with pysam.AlignmentFile(original_bam_path, "rb") as bam_in:
+        units = extraction_units(bam_in)
+    shard_prefix = output_bam_path + '.shard'
+    shard_bams = []
+
+    def merge_result(future):
+        shard_bam_path, shard_map_path, counts = future.result()
+        shard_bams.append(shard_bam_path)
+        for read_chrom, count in counts:
+            non_primary_counts[read_chrom] = non_primary_counts[read_chrom] + count
+        if shard_map_path is not None:
+            # QNAMEs seen in an earlier unit keep their first RG, as in a serial scan
+            with open(shard_map_path) as shard_map:
+                for line in shard_map:
+                    qname = line.split('\t', 1)[0]
+                    if qname not in processed_recovered_qnames:
+                        processed_recovered_qnames.add(qname)
+                        qname_rg_out.write(line)
+            os.remove(shard_map_path)
+
+    with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(original_bam_path, threads)) as pool:
+        pending = deque()
+        for unit_index, ranges in enumerate(units):
+            pending.append(pool.submit(extract_unit, unit_index, ranges, shard_prefix, original_rg_tag, format_options, threads))
+            while len(pending) > 2 * processes:
+                merge_result(pending.popleft())
+        while pending:
+            merge_result(pending.popleft())
+    # shards share the input header: concatenate the BGZF blocks without recompressing
+    pysam.cat('--no-PG', '-o', output_bam_path, *shard_bams)
+    for shard_bam_path in shard_bams:
+        os.remove(shard_bam_path)
 
 @click.command()
 @click.option('--original_bam_path', type=click.Path(exists=True))
 @click.option('-odir','--output_dir', type=click.Path())
-def extract_nonprimary_reads(original_bam_path, output_dir):
+@click.option('--original_rg_tag', type=click.STRING, default=None,
+              help='Store each read\'s RG in this aux tag (e.g. XR) instead of writing a QNAME -> RG map; patch with bamfile_patch.py patch-bam --original_rg_tag')
+@click.option('--threads', type=click.IntRange(min=1), default=1, help='htslib threads for BGZF decompression and compression of each BAM')
+@click.option('--compression_level', type=click.IntRange(0, 9), default=None,
+              help='BGZF compression level of non_primary.bam, e.g. 0 or 1 for an intermediate file (default: htslib default)')
+@click.option('--processes', type=click.IntRange(min=1), default=1,
+              help='Scan ranges of the indexed BAM in this many processes and concatenate their shards in order; '
+                   'selects the same reads as the default scan')
+def extract_nonprimary_reads(original_bam_path, output_dir, original_rg_tag, threads, compression_level, processes):
     sample_id = os.path.basename(original_bam_path).rstrip('.bam')
 
     processed_recovered_qnames = set()
@@ -23,21 +153,23 @@ def extract_nonprimary_reads(original_bam_path, output_dir):
 
     non_primary_counts = collections.defaultdict(int)
     # Open the second BAM file for reading
-    with pysam.AlignmentFile(original_bam_path, "rb") as bam_in:
-        # Open the output BAM file for writing
-        with pysam.AlignmentFile(output_bam_path, "wb", header=bam_in.header) as bam_out, open(output_qname_rg_path, 'w') as qname_rg_out:
-            qname_rg_out.write(f'QNAME\tRG\n')
-            for read in bam_in.fetch(until_eof=True):
-                # Process each read
-                # Check if the read or its mate is mapped to a primary chromosome
-                read_chrom = read.reference_name
-                mate_chrom = read.next_reference_name
-                if read.is_unmapped or read_chrom not in ALLOWED_CHROMOSOMES or mate_chrom not in ALLOWED_CHROMOSOMES:
-                    bam_out.write(read)
-                    non_primary_counts[read_chrom] = non_primary_counts[read_chrom] + 1
-                    if read.query_name not in processed_recovered_qnames:
-                        processed_recovered_qnames.add(read.query_name)
-                        qname_rg_out.write(f'{read.query_name}\t{read.get_tag("RG")}\n')
+    # pysam takes only wb/wb0 modes, other levels go through htslib's level option
+    format_options = None if compression_level is None else [f'level={compression_level}'.encode()]
+    with pysam.AlignmentFile(original_bam_path, "rb", threads=threads) as bam_in:
+        has_index = bam_in.has_index()
+        if not has_index and processes > 1:
+            print(f'No index for {original_bam_path}, scanning every read in one process', file=sys.stderr)
+        qname_rg_file = open(output_qname_rg_path, 'w') if original_rg_tag is None else contextlib.nullcontext()
+        with qname_rg_file as qname_rg_out:
+            if qname_rg_out is not None:
+                qname_rg_out.write(f'QNAME\tRG\n')
+            if processes > 1 and has_index:
+                parallel_extract(original_bam_path, output_bam_path, qname_rg_out, original_rg_tag, format_options, threads, processes,
+                                 non_primary_counts, processed_recovered_qnames)
+            else:
+                # Open the output BAM file for writing
+                with pysam.AlignmentFile(output_bam_path, "wb", header=bam_in.header, threads=threads, format_options=format_options) as bam_out:
+                    write_non_primary_reads(scan_non_primary_reads(bam_in), bam_out, qname_rg_out, original_rg_tag, non_primary_counts, processed_recovered_qnames)
 
                     # qname_rg_map[read.query_name] = read.get_tag('RG')
     
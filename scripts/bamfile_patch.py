@@ -7,13 +7,24 @@ from collections import defaultdict
 import time
 import logging
 import subprocess
-import pandas as pd
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
 ALLOWED_CHROMOSOMES = {'chr' + str(i) for i in range(1, 23)}
 ALLOWED_CHROMOSOMES.update(['chrX', 'chrY'])
 
+# QNAME -> RG map rows read per chunk, and patch reads looked up per batch
+MAP_CHUNK_BYTES = 4 * 1024 * 1024
+PATCH_BATCH = 100000
+FNV_OFFSET = np.uint64(0xcbf29ce484222325)
+FNV_PRIME = np.uint64(0x100000001b3)
+# offset basis of the second, independent QNAME hash that confirms lookups
+CHECK_OFFSET = np.uint64(0x84222325cbf29ce4)
+# QnameReadGroups keys: QNAME hash bits above a 16-bit read group code
+CODE_MASK = np.uint64(0xffff)
+HASH_MASK = ~CODE_MASK
+
 @click.group()
 def cli():
     pass
@@ -22,6 +33,139 @@ def replace_read_group(tags, read_group):
     # tags.append(('PG', 'BamPatch'))
     return [('RG', read_group) if tag == 'RG' else (tag, value) for tag, value in tags]
 
+def restore_read_group(tags, rg_tag):
+    """tags with RG set from the rg_tag tag stored at extraction, which is dropped"""
+    read_group = dict(tags)[rg_tag]
+    tags = [(tag, value) for tag, value in tags if tag != rg_tag]
+    if any(tag == 'RG' for tag, _ in tags):
+        return replace_read_group(tags, read_group)
+    return tags + [('RG', read_group)]
+
+def qname_hashes(qnames, offset=FNV_OFFSET):
+    """64-bit FNV-1a hashes of a list of QNAMEs (bytes), one column of characters at a time"""
+    lengths = np.fromiter(map(len, qnames), dtype=np.int64, count=len(qnames))
+    width = int(lengths.max()) if len(qnames) else 0
+    characters = np.array(qnames, dtype=f'S{max(width, 1)}').view(np.uint8).reshape(len(qnames), -1)
+    shortest = int(lengths.min()) if len(qnames) else 0
+    hashes = np.full(len(qnames), offset, dtype=np.uint64)
+    for i in range(width):
+        if i < shortest:
+            hashes ^= characters[:, i]
+            hashes *= FNV_PRIME
+        else:
+            hashes = np.where(lengths > i, (hashes ^ characters[:, i]) * FNV_PRIME, hashes)
+    return hashes
+
+class QnameReadGroups:
+    """QNAME -> RG lookup of a qname_rg_map.tsv, without a Python string per read.
+
+    Read groups are interned to 16-bit codes. Each QNAME is kept as one uint64 key, the
+    top 48 bits of its hash above its read group code, in a sorted array, and as a second,
+    independent 64-bit hash in another sorted array: 16 bytes a QNAME. Lookups hash a
+    batch of QNAMEs and binary search both arrays. QNAMEs whose hash is shared by a read
+    of another read group are kept in a small dict instead.
+
+    A QNAME that is not in the map raises KeyError unless both of its hashes are also
+    hashes of QNAMEs of the map, a chance of about n^2 / 2^112 for an n-row map (about
+    2 x 10^-18 at 10^8 rows); it would then get the read group of the QNAME sharing its key.
+    """
+
+    def __init__(self, qname_rg_map):
+        codes = {}
+        rows = self.count_rows(qname_rg_map)
+        keys = np.empty(rows, dtype=np.uint64)
+        checks = np.empty(rows, dtype=np.uint64)
+        filled = 0
+        for qnames, rgs in self.map_chunks(qname_rg_map):
+            chunk_codes = np.fromiter((codes.setdefault(rg, len(codes)) for rg in rgs), dtype=np.uint64, count=len(rgs))
+            if len(codes) > CODE_MASK + 1:
+                raise ValueError(f'ERROR: more than {CODE_MASK + 1} read groups in {qname_rg_map}')
+            keys[filled:filled + len(qnames)] = (qname_hashes(qnames) & HASH_MASK) | chunk_codes
+            checks[filled:filled + len(qnames)] = qname_hashes(qnames, CHECK_OFFSET)
+            filled += len(qnames)
+        self.keys = keys[:filled]
+        self.keys.sort()
+        self.checks = checks[:filled]
+        self.checks.sort()
+        self.read_groups = [rg.decode() for rg in codes]
+        self.collisions = self.find_collisions(qname_rg_map)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @staticmethod
+    def count_rows(qname_rg_map):
+        """Upper bound of the rows of the map: its newlines"""
+        with open(qname_rg_map, 'rb') as ifile:
+            return sum(block.count(b'\n') for block in iter(lambda: ifile.read(MAP_CHUNK_BYTES), b''))
+
+    @staticmethod
+    def map_chunks(qname_rg_map):
+        """(QNAMEs, RGs) lists of bytes of the map, MAP_CHUNK_BYTES at a time"""
+        with open(qname_rg_map, 'rb') as ifile:
+            ifile.readline()  # QNAME\tRG header
+            while True:
+                lines = ifile.readlines(MAP_CHUNK_BYTES)
+                if not lines:
+                    break
+                rows = [line.rstrip(b'\r\n').split(b'\t') for line in lines]
+                yield [row[0] for row in rows], [row[1] for row in rows]
+
+    def find_collisions(self, qname_rg_map):
+        """QNAME -> RG dict of the QNAMEs whose hash is shared by a read of another read group"""
+        colliding = []
+        for start in range(0, len(self.keys), PATCH_BATCH):
+            # keys are sorted: equal hashes of different read groups are neighbours
+            keys = self.keys[start:start + PATCH_BATCH + 1]
+            hashes = keys & HASH_MASK
+            colliding.append(hashes[1:][(hashes[1:] == hashes[:-1]) & (keys[1:] != keys[:-1])])
+        colliding = np.unique(np.concatenate(colliding)) if colliding else colliding
+        if not len(colliding):
+            return {}
+        logger.info(f'{len(colliding)} QNAME hashes shared by reads of different read groups')
+        collisions = {}
+        for qnames, rgs in self.map_chunks(qname_rg_map):
+            for i in np.flatnonzero(np.isin(qname_hashes(qnames) & HASH_MASK, colliding)):
+                collisions[qnames[i].decode()] = rgs[i].decode()
+        return collisions
+
+    @staticmethod
+    def sorted_index(values, queries):
+        """Index of each query's left insertion point in sorted values, clipped to the last value"""
+        return np.minimum(np.searchsorted(values, queries), max(len(values) - 1, 0))
+
+    def lookup(self, qnames):
+        """RG of each QNAME (str) of a batch, KeyError for a QNAME that is not in the map"""
+        encoded = [qname.encode() for qname in qnames]
+        hashes = qname_hashes(encoded) & HASH_MASK
+        checks = qname_hashes(encoded, CHECK_OFFSET)
+        # code 0 sorts first, so the left insertion point is the first key with this hash
+        index = self.sorted_index(self.keys, hashes)
+        if len(self.keys):
+            found = ((self.keys[index] & HASH_MASK) == hashes) & (self.checks[self.sorted_index(self.checks, checks)] == checks)
+        else:
+            found = np.zeros(len(hashes), dtype=bool)
+        if not found.all():
+            raise KeyError(qnames[int(np.argmin(found))])
+        read_groups = self.read_groups
+        result = [read_groups[code] for code in (self.keys[index] & CODE_MASK).tolist()]
+        if self.collisions:
+            for i, qname in enumerate(qnames):
+                if qname in self.collisions:
+                    result[i] = self.collisions[qname]
+        return result
+
+def read_batches(bam, batch_size=PATCH_BATCH):
+    """Lists of up to batch_size reads of a BAM, in file order"""
+    batch = []
+    for read in bam.fetch(until_eof=True):
+        batch.append(read)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
 def build_patch_qnames(bam_file):
     logger.info('Building patch qnames set')
     qnames = set()
@@ -38,16 +182,24 @@ def build_patch_qnames(bam_file):
 @click.option('--non_primary_bam_path', type=click.Path(exists=True))
 @click.option('--original_bam_path', type=click.Path(exists=True))
 @click.option('--qname_rg_map', type=click.Path(exists=True))
+@click.option('--original_rg_tag', type=click.STRING, default=None,
+              help='Restore RG from this aux tag, set by bamfile_extract_nonprimary_reads.py --original_rg_tag, instead of --qname_rg_map')
 @click.option('--sample_id', type=click.STRING)
 @click.option('-odir','--output_dir', type=click.Path(), default='./')
-def patch_bam(non_primary_bam_path,original_bam_path, qname_rg_map, sample_id, output_dir):
+@click.option('--threads', type=click.IntRange(min=1), default=1, help='htslib threads for BGZF decompression and compression of each BAM')
+@click.option('--compression_level', type=click.IntRange(0, 9), default=None,
+              help='BGZF compression level of patch_rg_update.bam, e.g. 0 or 1 for an intermediate file (default: htslib default)')
+def patch_bam(non_primary_bam_path,original_bam_path, qname_rg_map, original_rg_tag, sample_id, output_dir, threads, compression_level):
+    if (qname_rg_map is None) == (original_rg_tag is None):
+        raise click.UsageError('one of --qname_rg_map or --original_rg_tag is required')
     os.makedirs(output_dir, exist_ok=True)
     # sample_id = os.path.basename(original_bam_path).rstrip('.bam')
     logging.basicConfig(filename=f'{output_dir}/{sample_id}.bam_patch.log', level=logging.INFO)
     start = time.time()
 
-    qname_rg_df = pd.read_csv(qname_rg_map, sep='\t')
-    original_read_groups = pd.Series(qname_rg_df['RG'].values, index=qname_rg_df['QNAME']).to_dict()
+    if qname_rg_map is not None:
+        original_read_groups = QnameReadGroups(qname_rg_map)
+        logger.info(f'Time to load {len(original_read_groups)} QNAME read groups: {time.time() - start: .2f} seconds')
 
     end = time.time()
     lap = end
@@ -80,19 +232,28 @@ def patch_bam(non_primary_bam_path,original_bam_path, qname_rg_map, sample_id, o
     original_bam.close()
 
     patch_out_path = os.path.join(output_dir, f'{sample_id}.patch_rg_update.bam')
-    patch_bam = pysam.AlignmentFile(non_primary_bam_path, "rb")
+    patch_bam = pysam.AlignmentFile(non_primary_bam_path, "rb", threads=threads)
     patch_header = patch_bam.header.to_dict()
     pg_entries = patch_header.get('PG', [])
     pg_entries.append(mark_duplicates_pg_entry)
     pg_entries.append(bamfile_patch_pg_entry)
     patch_header['RG'] = base_rg
     patch_header['PG'] = pg_entries
-    with pysam.AlignmentFile(patch_out_path, "wb", header=patch_header) as patch_out:
+    # pysam takes only wb/wb0 modes, other levels go through htslib's level option
+    format_options = None if compression_level is None else [f'level={compression_level}'.encode()]
+    with pysam.AlignmentFile(patch_out_path, "wb", header=patch_header, threads=threads, format_options=format_options) as patch_out:
         logger.info(f'\n{"*"*75}\nUpdating patch with original RG')
-        for read in patch_bam.fetch(until_eof=True):
-            qname = read.query_name
-            read.set_tags(replace_read_group(read.get_tags(), original_read_groups[qname]))
-            patch_out.write(read)
+        if original_rg_tag is not None:
+            # single streaming pass, the original RG travels with each read
+            for read in patch_bam.fetch(until_eof=True):
+                read.set_tags(restore_read_group(read.get_tags(), original_rg_tag))
+                patch_out.write(read)
+        else:
+            for reads in read_batches(patch_bam):
+                read_groups = original_read_groups.lookup([read.query_name for read in reads])
+                for read, read_group in zip(reads, read_groups):
+                    read.set_tags(replace_read_group(read.get_tags(), read_group))
+                    patch_out.write(read)
     patch_bam.close()
     end = time.time()
     logger.info(f'Time to process patch RG update: {end - lap: .2f} seconds. Total time {(end - start) / 60: .2f} minutes' )
@@ -7,11 +7,20 @@ The script merges calls from DeepVariant, HaplotypeCaller and Strelka2
 # at some point, stop using print statements to log and use an actual logging framework.
 
 import argparse
+import collections
 import csv
 import datetime
+import multiprocessing
 import re
 import sys
 
+from vcf_io import open_vcf, open_vcf_output
+
+try:
+    import numpy as np
+except ImportError:  # only needed for --sidecar/--summary
+    np = None
+
 # global variables:
 # VCF structure (used instead of index numbers for readability)
 chrom = 0
@@ -24,19 +33,88 @@ filt = 6
 info = 7
 frmt = 8
 
+# data lines handed to the stream engine at a time
+CHUNK_SIZE = 1000
+# distinct FORMAT strings kept by the stream engine's layout cache; a merged
+# file only has a few dozen, the bound guards against pathological inputs
+LAYOUT_CACHE_SIZE = 1024
+
 
 ############################################# Functions #############################################
 
 
 def get_args():
-    """Handle command line arguments (input and output file names)."""
+    """Handle command line arguments (input/output file names and engine)."""
     parser = argparse.ArgumentParser(
         description="Takes VCF file with samples that have been called by the three callers and returns a VCF file where the genotypes from each caller are combined."
     )
-    parser.add_argument("infile", help="Input VCF file name")
+    parser.add_argument(
+        "infile",
+        help="Input VCF file name: plain, gzip/bgzip compressed VCF or BCF. Use '-' to read from stdin "
+        "(stream engine). The legacy engine only reads plain VCF files",
+    )
     parser.add_argument("outfile", nargs='?', help="Output VCF file name. If not provided then output to stdout", )
+    parser.add_argument(
+        "--input-format",
+        dest="input_format",
+        choices=["auto", "vcf", "bcf"],
+        default="auto",
+        help="'vcf': plain/gzip/bgzip VCF; 'bcf': read through pysam/htslib (needed for BCF on stdin, "
+        "e.g. bcftools merge -Ou | genotype_union.py --input-format bcf -); 'auto': detect from the file",
+    )
+    parser.add_argument(
+        "-O",
+        "--output-type",
+        dest="output_type",
+        choices=["v", "z"],
+        default=None,
+        help="v: uncompressed VCF, z: bgzip compressed VCF. Default: z if outfile ends with .gz, otherwise v",
+    )
+    parser.add_argument(
+        "--io-threads",
+        dest="io_threads",
+        type=int,
+        default=None,
+        help="Threads for BGZF decompression/compression and htslib decoding. Defaults to --threads",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["stream", "legacy"],
+        default="stream",
+        help="Record engine. 'stream' works on raw byte lines; 'legacy' is the original csv based implementation",
+    )
+    parser.add_argument(
+        "--chunk-size", dest="chunk_size", type=int, default=CHUNK_SIZE, help="Records processed per chunk (stream engine)"
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="Worker processes (stream engine). Chunks are unioned in parallel and written in input order",
+    )
+    parser.add_argument(
+        "--sidecar",
+        metavar="PREFIX",
+        default=None,
+        help="Also write a columnar sidecar (PREFIX.index.json + PREFIX.*.npy: caller set and 2-bit packed "
+        "concensus_GT / dv_priority_GT per variant, see union_sidecar.py). Needs numpy; stream engine",
+    )
+    parser.add_argument(
+        "--summary",
+        metavar="JSON",
+        default=None,
+        help="Also write concordance counts (records per caller set and variant type, per-sample concordant/"
+        "discordant/missing calls) to JSON; reduce interval summaries with union_summary.py. Needs numpy; stream engine",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print FORMAT layout cache hit/miss counters to stderr when done (stream engine)",
+    )
     results = parser.parse_args()
-    return results.infile, results.outfile
+    if results.io_threads is None:
+        results.io_threads = results.threads
+    return results
 
 
 def check_file(fname):
@@ -268,12 +346,13 @@ def combine_genotypes(line, start1, end1, start2, end2, start3, end3):
     Finally, If only one caller has call, it's set to that GT
     """
 
-    for x, y, z in zip(line[start1:end1], line[start2:end2], line[start3:end3]):
+    # Carry the column position explicitly: looking it up with line.index(x) is a linear scan per
+    # sample and returns the wrong column when an earlier field holds the same string (e.g. ".").
+    for field, (x, y, z) in enumerate(zip(line[start1:end1], line[start2:end2], line[start3:end3]), start1):
         geno1 = x.split(":")
         geno2 = y.split(":")
         geno3 = z.split(":")
-        field = line.index(x)
-    
+
         concensus_gt = get_concensus_gt(geno1[0], geno2[0], geno3[0],)
         dv_priority_gt = get_dv_priority_gt(geno1[0], geno2[0], geno3[0])
         # Consensus GT and concordant GT are identical for variants found by two or three callers
@@ -353,21 +432,15 @@ def get_first_data_line(infile):
                 return line
     return -1
 
-#####################################################################################################
 
-
-if __name__ == "__main__":
-    ts = str(datetime.datetime.now())
-    ver = "someversion"  # https://stackoverflow.com/questions/5581722/how-can-i-rewrite-python-version-with-git
-    scriptName = sys.argv[0]
-    cmdString = " ".join(sys.argv)
-    infile, outfile = get_args()
-    # check_file(infile)
-    # headerLine = get_header(infile)
+def legacy_union(infile, out, ts, ver, scriptName, cmdString):
+    """Original csv/list based engine. Kept as the reference implementation
+    the streaming engine is benchmarked and checked against.
+    """
     first_data_line = get_first_data_line(infile)
     if first_data_line != -1:
         start1, end1, start2, end2, start3, end3 = find_genotype_indices(first_data_line)
-    with open(infile, "r") as file, file_or_stdout(outfile) as out:
+    with open(infile, "r") as file:
         for line in csv.reader(file, delimiter="\t"):
             if re.search(r"#", line[chrom]) is None:
                 line = evaluate_variant_line(line, start1, end1, start2, end2, start3, end3)
@@ -377,3 +450,371 @@ if __name__ == "__main__":
                 out.write("\t".join(line[0:start2]) + "\n")
             else:
                 out.write("\t".join(line) + "\n")
+
+
+########################################## Streaming engine ##########################################
+
+# caller presence in FORMAT (HC, DV, strelka2) -> (set tag, FILTER, keep ID, combine genotypes)
+CALLER_SETS = {
+    (False, True, False): (b"DV", b"oneCaller", False, False),
+    (True, False, False): (b"HC", b"oneCaller", True, False),
+    (True, True, False): (b"HC-DV", b"twoCallers", False, True),
+    (False, False, True): (b"strelka2", b"oneCaller", False, False),
+    (True, False, True): (b"HC-strelka2", b"twoCallers", False, True),
+    (False, True, True): (b"DV-strelka2", b"twoCallers", False, True),
+    (True, True, True): (b"HC-DV-strelka2", b"threeCallers", False, True),
+}
+
+UNION_FORMAT_SUFFIX = b":concensus_GT:dv_priority_GT"
+NO_CALL = b"./."
+MISSING = b"."
+HET = b"0/1"
+FLIPPED_HET = b"1/0"
+
+
+class FormatLayout:
+    """Everything needed to rewrite a record that only depends on its FORMAT string.
+    Built once per distinct FORMAT string and shared by every record using it.
+    """
+    __slots__ = ("set_info", "filter", "keep_id", "combine", "format", "num_keys")
+
+    def __init__(self, format_field):
+        callers = (b":HC_" in format_field, b":DV_" in format_field, b":strelka2_" in format_field)
+        if callers not in CALLER_SETS:
+            raise ValueError("ERROR: No caller annotation found in FORMAT field.")
+        set_tag, self.filter, self.keep_id, self.combine = CALLER_SETS[callers]
+        self.set_info = b";set=" + set_tag
+        self.format = format_field + UNION_FORMAT_SUFFIX
+        self.num_keys = format_field.count(b":") + 1
+
+
+class LayoutCache:
+    """LRU-bounded memo of FORMAT string -> FormatLayout, with hit/miss counters."""
+
+    def __init__(self, maxsize=LAYOUT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.layouts = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, format_field):
+        layout = self.layouts.get(format_field)
+        if layout is not None:
+            self.hits += 1
+            self.layouts.move_to_end(format_field)
+            return layout
+        self.misses += 1
+        layout = self.layouts[format_field] = FormatLayout(format_field)
+        if len(self.layouts) > self.maxsize:
+            self.layouts.popitem(last=False)
+        return layout
+
+    def __len__(self):
+        return len(self.layouts)
+
+
+class UnionEngine:
+    """Byte-oriented genotype union. Produces the same records as evaluate_variant_line,
+    working on raw VCF lines with one split and one join per record.
+    """
+
+    def __init__(self, num_columns):
+        self.start1, self.end1, self.start2, self.end2, self.start3, self.end3 = find_genotype_indices(
+            range(num_columns)
+        )
+        self.layouts = LayoutCache()
+        # (HC GT, DV GT, strelka2 GT) -> (concensus_GT, dv_priority_GT); only a handful of distinct keys occur
+        self.genotype_calls = {}
+
+    def prepare(self, line):
+        """Split a data line and apply the rewrites that only depend on FORMAT
+        (set tag, FILTER, FORMAT suffix and ID).
+        """
+        fields = line.rstrip(b"\r\n").split(b"\t")
+        layout = self.layouts.get(fields[frmt])
+        fields[info] += layout.set_info
+        fields[filt] = layout.filter
+        fields[frmt] = layout.format
+        if not layout.keep_id:
+            fields[snpID] = MISSING
+        return fields, layout
+
+    def process(self, line):
+        """Union a single data line (bytes, with or without the trailing newline)."""
+        fields, layout = self.prepare(line)
+        if layout.combine:
+            fields[9:] = self.combine(fields)
+        else:
+            fields[9:] = self.remove_empty(fields)
+        return b"\t".join(fields) + b"\n"
+
+    def process_chunk(self, lines):
+        return [self.process(line) for line in lines]
+
+    def remove_empty(self, fields):
+        """Streaming counterpart of remove_empty_genotypes. Each caller block is checked and
+        rewritten as one tab-joined string, so the sample columns are returned as a single field.
+        """
+        block = b"\t".join(fields[self.start1:self.end1])
+        if b"0" in block or b"1" in block:
+            return [block.replace(b"\t", b":./.:./.\t") + b":./.:./."]
+        block = b"\t".join(fields[self.start2:self.end2])
+        if b"0" in block or b"1" in block:
+            return [b"\t".join([s + b":./.:" + s.split(b":", 1)[0] for s in fields[self.start2:self.end2]])]
+        block = b"\t".join(fields[self.start3:self.end3])
+        if b"0" in block or b"1" in block:
+            return [block.replace(b"\t", b":./.:./.\t") + b":./.:./."]
+        raise ValueError("remove_empty_genotypes ERROR: All genotype fields are blank.\n" + repr(fields))
+
+    def combine(self, fields):
+        """Streaming counterpart of combine_genotypes. Columns are addressed by position."""
+        merged = []
+        genotype_calls = self.genotype_calls
+        for x, y, z in zip(fields[self.start1:self.end1], fields[self.start2:self.end2], fields[self.start3:self.end3]):
+            geno1 = x.split(b":")
+            geno2 = y.split(b":")
+            geno3 = z.split(b":")
+            gts = (geno1[0], geno2[0], geno3[0])
+            calls = genotype_calls.get(gts)
+            if calls is None:
+                calls = genotype_calls[gts] = union_genotype_calls(*gts)
+            geno1[0] = calls[0]
+            geno1 = merge_subfields(geno1, geno2, geno3)
+            geno1.extend(calls)
+            merged.append(b":".join(geno1))
+        return merged
+
+
+def merge_subfields(geno1, geno2, geno3):
+    """Fill '.' sub-fields of geno1 from geno2, then geno3 (see combine_genotypes)."""
+    if len(geno1) == len(geno2) == len(geno3):
+        return [g1 if g1 != MISSING else (g2 if g2 != MISSING else g3) for g1, g2, g3 in zip(geno1, geno2, geno3)]
+    for i, g1 in enumerate(geno1):
+        if g1 == MISSING:
+            if geno2[i] != MISSING:
+                geno1[i] = geno2[i]
+            elif geno3[i] != MISSING:
+                geno1[i] = geno3[i]
+    return geno1
+
+
+def union_genotype_calls(gt1, gt2, gt3):
+    """Byte version of get_concensus_gt and get_dv_priority_gt.
+    Returns (concensus_GT, dv_priority_GT).
+    """
+    gt1_flip = HET if gt1 == FLIPPED_HET else gt1
+    gt2_flip = HET if gt2 == FLIPPED_HET else gt2
+    gt3_flip = HET if gt3 == FLIPPED_HET else gt3
+
+    if gt1_flip == gt2_flip or gt1_flip == gt3_flip:
+        concensus_gt = gt1
+    elif gt2_flip == gt3_flip:
+        concensus_gt = gt2
+    else:
+        concensus_gt = NO_CALL
+    if b"." not in gt2:
+        dv_priority_gt = gt2
+    elif gt1_flip == gt3_flip:
+        dv_priority_gt = gt1
+    else:
+        dv_priority_gt = NO_CALL
+    return concensus_gt, dv_priority_gt
+
+
+ENGINES = {
+    "stream": UnionEngine,
+}
+
+
+# per-process engine and output collector extractors used by the --threads worker pool
+_worker_engine = None
+_worker_extractors = []
+
+
+def _init_worker(engine_class, num_columns, extractor_classes):
+    global _worker_engine, _worker_extractors
+    _worker_engine = engine_class(num_columns)
+    _worker_extractors = [extractor_class() for extractor_class in extractor_classes]
+
+
+def _union_chunk(chunk):
+    """Worker task: union a newline-terminated block of data lines.
+    Returns the output block, the chunk's FORMAT layout cache hits and misses
+    and what each collector's extractor took from the unioned lines.
+    """
+    cache = _worker_engine.layouts
+    hits, misses = cache.hits, cache.misses
+    lines = _worker_engine.process_chunk(chunk.split(b"\n")[:-1])
+    return b"".join(lines), cache.hits - hits, cache.misses - misses, [extractor(lines) for extractor in _worker_extractors]
+
+
+class ChunkDispatcher:
+    """Hands chunks of data lines to an engine, either in-process or through a
+    multiprocessing pool, and writes the results to out_handle in input order.
+
+    collectors receive what their `extractor` (a class, instantiated per process and
+    called with each chunk of unioned lines) returns, through write(columns, num_samples),
+    and are closed with close(num_samples); see union_sidecar.py and union_summary.py.
+    """
+
+    def __init__(self, out_handle, engine_class, threads, collectors=()):
+        self.out_handle = out_handle
+        self.engine_class = engine_class
+        self.threads = threads
+        self.engine = None
+        self.pool = None
+        # bounded so the reader can not run arbitrarily far ahead of the workers
+        self.pending = collections.deque()
+        self.max_pending = 2 * threads
+        # FORMAT layout cache counters summed over the worker processes
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.collectors = list(collectors)
+        self.extractors = []
+        self.num_samples = 0
+
+    def start(self, num_columns):
+        start1, end1 = find_genotype_indices(range(num_columns))[0:2]
+        self.num_samples = end1 - start1
+        extractor_classes = [collector.extractor for collector in self.collectors]
+        if self.threads > 1:
+            self.pool = multiprocessing.Pool(
+                self.threads, initializer=_init_worker, initargs=(self.engine_class, num_columns, extractor_classes)
+            )
+        else:
+            self.engine = self.engine_class(num_columns)
+            self.extractors = [extractor_class() for extractor_class in extractor_classes]
+
+    @property
+    def started(self):
+        return self.engine is not None or self.pool is not None
+
+    def submit(self, chunk):
+        if self.pool is None:
+            lines = self.engine.process_chunk(chunk)
+            self.out_handle.writelines(lines)
+            self.collect([extractor(lines) for extractor in self.extractors])
+            return
+        self.pending.append(self.pool.apply_async(_union_chunk, (b"".join(chunk),)))
+        while len(self.pending) > self.max_pending:
+            self.write_result()
+
+    def write_result(self):
+        output, hits, misses, extracted = self.pending.popleft().get()
+        self.out_handle.write(output)
+        self.cache_hits += hits
+        self.cache_misses += misses
+        self.collect(extracted)
+
+    def collect(self, extracted):
+        for collector, columns in zip(self.collectors, extracted):
+            collector.write(columns, self.num_samples)
+
+    def flush(self):
+        while self.pending:
+            self.write_result()
+
+    def cache_stats(self):
+        """(hits, misses) of the FORMAT layout cache(s)."""
+        if self.engine is not None:
+            return self.engine.layouts.hits, self.engine.layouts.misses
+        return self.cache_hits, self.cache_misses
+
+    def close(self):
+        self.flush()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+        for collector in self.collectors:
+            collector.close(self.num_samples)
+
+
+def stream_union(
+    in_handle, out_handle, ts, ver, scriptName, cmdString, engine_class=UnionEngine, chunk_size=CHUNK_SIZE, threads=1, collectors=()
+):
+    """Run a record engine over a binary VCF stream, chunk_size records at a time.
+    With threads > 1 the chunks are processed by a pool of worker processes and
+    written back in input order; the header is handled once, in this process.
+    Sample blocks are sized from the #CHROM line, or from the first record
+    when the stream has no header (e.g. a chunk of a larger file).
+    collectors: e.g. union_sidecar.SidecarWriter / union_summary.ConcordanceSummary,
+    fed the unioned records and closed along the VCF (see ChunkDispatcher).
+    """
+    dispatcher = ChunkDispatcher(out_handle, engine_class, threads, collectors)
+    chunk = []
+    try:
+        for line in in_handle:
+            if not line.startswith(b"#"):
+                if not dispatcher.started:
+                    dispatcher.start(line.count(b"\t") + 1)
+                if not line.endswith(b"\n"):
+                    line += b"\n"
+                chunk.append(line)
+                if len(chunk) >= chunk_size:
+                    dispatcher.submit(chunk)
+                    chunk = []
+                continue
+            if chunk:
+                dispatcher.submit(chunk)
+                chunk = []
+            dispatcher.flush()
+            if line.startswith(b"#CHROM"):
+                header = line.rstrip(b"\r\n").split(b"\t")
+                if not dispatcher.started:
+                    dispatcher.start(len(header))
+                start2 = find_genotype_indices(header)[2]
+                for collector in collectors:
+                    collector.set_samples(header[9:start2])
+                out_handle.write("\n".join(add_headers(ts, ver, scriptName, cmdString)).encode() + b"\n")
+                out_handle.write(b"\t".join(header[0:start2]) + b"\n")
+            else:
+                out_handle.write(line.rstrip(b"\r\n") + b"\n")
+        if chunk:
+            dispatcher.submit(chunk)
+    finally:
+        dispatcher.close()
+    return dispatcher
+
+
+def print_stats(dispatcher, handle=sys.stderr):
+    hits, misses = dispatcher.cache_stats()
+    lookups = hits + misses
+    handle.write(
+        "FORMAT layout cache: {} lookups, {} hits, {} misses, hit rate {:.2%}\n".format(
+            lookups, hits, misses, hits / lookups if lookups else 0.0
+        )
+    )
+
+#####################################################################################################
+
+
+if __name__ == "__main__":
+    ts = str(datetime.datetime.now())
+    ver = "someversion"  # https://stackoverflow.com/questions/5581722/how-can-i-rewrite-python-version-with-git
+    scriptName = sys.argv[0]
+    cmdString = " ".join(sys.argv)
+    args = get_args()
+    collectors = []
+    if args.sidecar is not None or args.summary is not None:
+        if args.engine == "legacy":
+            sys.exit("ERROR: --sidecar/--summary require the stream engine")
+        if np is None:
+            sys.exit("ERROR: --sidecar/--summary require numpy to be installed")
+    if args.sidecar is not None:
+        from union_sidecar import SidecarWriter
+        collectors.append(SidecarWriter(args.sidecar))
+    if args.summary is not None:
+        from union_summary import ConcordanceSummary
+        collectors.append(ConcordanceSummary(args.summary))
+    if args.engine == "legacy":
+        with file_or_stdout(args.outfile) as out:
+            legacy_union(args.infile, out, ts, ver, scriptName, cmdString)
+    else:
+        with open_vcf(args.infile, args.input_format, args.io_threads) as in_handle, open_vcf_output(
+            args.outfile, args.output_type, args.io_threads
+        ) as out:
+            dispatcher = stream_union(
+                in_handle, out, ts, ver, scriptName, cmdString, ENGINES[args.engine], args.chunk_size, args.threads, collectors
+            )
+        if args.stats:
+            print_stats(dispatcher)
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+
+"""
+Fused harmonize engine: caller labeling + merge by variant + genotype union in one pass.
+
+Takes the normalized (split multi-allelic, position sorted) VCFs of HaplotypeCaller,
+DeepVariant and strelka2 and streams a k-way merge over them keyed on
+(CHROM, POS, REF, ALT). Each group of matching records is written directly as the
+unioned record that
+
+    prepend_labels.py <caller> | bcftools merge --force-samples -m none | genotype_union.py
+
+produces, without writing the labeled or merged intermediate files:
+
+- INFO/FORMAT keys are prefixed with the caller label, GT is duplicated as <caller>_GT
+  and the caller's QUAL is kept as INFO <caller>_QUAL (as prepend_labels.py)
+- records are matched on (CHROM, POS, REF, ALT); QUAL is the highest QUAL of the
+  matched records (as bcftools merge)
+- set tag, FILTER, ID, concensus_GT and dv_priority_GT (as genotype_union.py)
+
+Samples are paired by column position (as bcftools merge --force-samples) and named
+after the HaplotypeCaller VCF. Values are passed through verbatim rather than
+re-encoded by htslib, and INFO/FORMAT keys are ordered HC, DV, strelka2.
+"""
+
+import argparse
+import datetime
+import heapq
+import itertools
+import sys
+
+from genotype_union import CALLER_SETS, NO_CALL, MISSING, UNION_FORMAT_SUFFIX, add_headers, union_genotype_calls
+from prepend_labels import label_header_line, label_info, label_keys
+from vcf_io import open_vcf, open_vcf_output
+
+# order matters: it is the caller order of genotype_union (HC, DV, strelka2)
+CALLER_LABELS = (b"HC", b"DV", b"strelka2")
+
+chrom, pos, snpID, ref, alt, qual, filt, info, frmt = range(9)
+
+
+def get_args():
+    """Handle command line arguments (input and output file names)."""
+    parser = argparse.ArgumentParser(
+        description="Label, merge and genotype-union the normalized HaplotypeCaller, DeepVariant and strelka2 VCFs in one pass."
+    )
+    parser.add_argument("--haplotypecaller", required=True, help="Normalized HaplotypeCaller VCF (plain or bgzip compressed).")
+    parser.add_argument("--deepvariant", required=True, help="Normalized DeepVariant VCF (plain or bgzip compressed).")
+    parser.add_argument("--strelka2", required=True, help="Normalized strelka2 VCF (plain or bgzip compressed).")
+    parser.add_argument("outfile", nargs="?", default=None, help="Output VCF file (default: stdout).")
+    parser.add_argument(
+        "-O",
+        "--output-type",
+        choices=["v", "z"],
+        default=None,
+        help="Output type: v = uncompressed VCF, z = BGZF compressed VCF (default: z if outfile ends with .gz, otherwise v).",
+    )
+    parser.add_argument(
+        "--io-threads",
+        type=int,
+        default=1,
+        help="Threads used for BGZF decompression of each input and for compression of the output (default: 1).",
+    )
+    return parser.parse_args()
+
+
+def header_key(line):
+    """Identity of a header line when merging headers: (type, ID) for structured lines."""
+    if line.endswith(b">") and b"=<ID=" in line:
+        return line[:line.index(b",")] if b"," in line else line
+    return line
+
+
+def read_header(lines):
+    """Consume the header of a VCF line iterator. Returns the ## lines and the #CHROM columns."""
+    meta = []
+    for line in lines:
+        line = line.rstrip(b"\r\n")
+        if line.startswith(b"#CHROM"):
+            return meta, line.split(b"\t")
+        meta.append(line)
+    sys.exit("ERROR: VCF header without a #CHROM line")
+
+
+def merge_headers(headers):
+    """Union of the labeled ## lines of the callers, first occurrence wins."""
+    merged = []
+    seen = set()
+    for caller, meta in zip(CALLER_LABELS, headers):
+        for line in meta:
+            for labeled in label_header_line(line, caller):
+                key = header_key(labeled)
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(labeled)
+    return merged
+
+
+class ContigOrder:
+    """Sort rank of contigs: header ##contig order, then order of first appearance."""
+
+    def __init__(self, meta):
+        self.rank = {}
+        for line in meta:
+            if line.startswith(b"##contig=<ID="):
+                self.rank.setdefault(line[len(b"##contig=<ID="):].split(b",")[0].rstrip(b">"), len(self.rank))
+
+    def __call__(self, contig):
+        rank = self.rank.get(contig)
+        if rank is None:
+            rank = self.rank[contig] = len(self.rank)
+        return rank
+
+
+def caller_records(lines, caller_index, contig_rank):
+    """Sort keys + split fields of the data lines of one caller."""
+    for seq, line in enumerate(lines):
+        fields = line.rstrip(b"\r\n").split(b"\t")
+        yield contig_rank(fields[chrom]), int(fields[pos]), caller_index, seq, fields
+
+
+class HarmonizeEngine:
+    """Builds the unioned record from the matching records of the three callers."""
+
+    def __init__(self, num_samples):
+        self.num_samples = num_samples
+        # (caller, FORMAT) -> (labeled FORMAT keys, number of keys)
+        self.formats = {}
+        self.genotype_calls = {}
+
+    def caller_format(self, caller, format_field):
+        key = (caller, format_field)
+        layout = self.formats.get(key)
+        if layout is None:
+            layout = self.formats[key] = (label_keys(format_field, caller, b":"), format_field.count(b":") + 1)
+        return layout
+
+    def samples(self, caller, fields):
+        """Sample columns of a caller record, padded to the full FORMAT width."""
+        labeled_format, num_keys = self.caller_format(caller, fields[frmt])
+        samples = fields[9:]
+        if len(samples) != self.num_samples:
+            raise ValueError("ERROR: {} record has {} samples, expected {}\n{!r}".format(
+                caller.decode(), len(samples), self.num_samples, fields[:5]))
+        for i, sample in enumerate(samples):
+            missing_keys = num_keys - 1 - sample.count(b":")
+            if missing_keys > 0:
+                samples[i] = sample + b":." * missing_keys
+        return labeled_format, samples
+
+    def union(self, records):
+        """records: per caller (HC, DV, strelka2) the matching record's fields, or None."""
+        set_tag, filter_field, keep_id, combine = CALLER_SETS[tuple(record is not None for record in records)]
+        present = [(caller, record) for caller, record in zip(CALLER_LABELS, records) if record is not None]
+        first = present[0][1]
+        quals = [record[qual] for _, record in present if record[qual] != MISSING]
+        out = first[:5] + [
+            max(quals, key=float) if quals else MISSING,
+            filter_field,
+            b";".join(label_info(record[info], record[qual], caller) for caller, record in present) + b";set=" + set_tag,
+        ]
+        if not keep_id:
+            out[snpID] = MISSING
+
+        formats = []
+        blocks = []
+        for caller, record in present:
+            labeled_format, samples = self.samples(caller, record)
+            formats.append(labeled_format)
+            blocks.append(samples)
+        out.append(b"GT:" + b":".join(formats) + UNION_FORMAT_SUFFIX)
+
+        if combine:
+            out.extend(self.combine(records, blocks))
+        else:
+            out.extend(self.single_caller(present[0][0], blocks[0], first))
+        return b"\t".join(out) + b"\n"
+
+    def single_caller(self, caller, samples, fields):
+        """Counterpart of remove_empty_genotypes for a record called by one caller."""
+        if not any(b"0" in sample or b"1" in sample for sample in samples):
+            raise ValueError("remove_empty_genotypes ERROR: All genotype fields are blank.\n" + repr(fields))
+        if caller == b"DV":
+            return [gt + b":" + sample + b":./.:" + gt for gt, sample in ((s.split(b":", 1)[0], s) for s in samples)]
+        return [sample.split(b":", 1)[0] + b":" + sample + b":./.:./." for sample in samples]
+
+    def combine(self, records, blocks):
+        """Counterpart of combine_genotypes. After the merge the callers' sub-fields never
+        overlap, so each sample is concensus_GT followed by the callers' own values.
+        """
+        gt_columns = []
+        present_blocks = iter(blocks)
+        for record in records:
+            if record is None:
+                gt_columns.append(itertools.repeat(NO_CALL))
+            else:
+                gt_columns.append([sample.split(b":", 1)[0] for sample in next(present_blocks)])
+        merged = []
+        genotype_calls = self.genotype_calls
+        for gts, samples in zip(zip(*gt_columns), zip(*blocks)):
+            calls = genotype_calls.get(gts)
+            if calls is None:
+                calls = genotype_calls[gts] = union_genotype_calls(*gts)
+            gt = calls[0]
+            if gt == MISSING:
+                gt = gts[1] if gts[1] != MISSING else gts[2]
+            merged.append(b":".join([gt, *samples, *calls]))
+        return merged
+
+
+def harmonize(handles, out_handle, ts, ver, scriptName, cmdString):
+    """Merge the labeled caller streams (HC, DV, strelka2) into out_handle."""
+    headers = [read_header(handle) for handle in handles]
+    sample_names = headers[0][1]
+    for caller, (_, columns) in zip(CALLER_LABELS, headers):
+        if len(columns) != len(sample_names):
+            sys.exit("ERROR: {} VCF has {} samples, HaplotypeCaller VCF has {}".format(
+                caller.decode(), len(columns) - 9, len(sample_names) - 9))
+    meta = merge_headers([header[0] for header in headers])
+    out_handle.write(b"\n".join(meta) + b"\n")
+    out_handle.write("\n".join(add_headers(ts, ver, scriptName, cmdString)).encode() + b"\n")
+    out_handle.write(b"\t".join(sample_names) + b"\n")
+
+    engine = HarmonizeEngine(len(sample_names) - 9)
+    contig_rank = ContigOrder(meta)
+    merged = heapq.merge(*[caller_records(handle, i, contig_rank) for i, handle in enumerate(handles)])
+    for _, site in itertools.groupby(merged, key=lambda record: record[:2]):
+        # (REF, ALT) -> per caller, the records at this site, in file order
+        variants = {}
+        for _, _, caller_index, _, fields in site:
+            variants.setdefault((fields[ref], fields[alt]), ([], [], []))[caller_index].append(fields)
+        for calls in variants.values():
+            # duplicate records of a caller are paired up by occurrence
+            for i in range(max(len(call) for call in calls)):
+                out_handle.write(engine.union([call[i] if i < len(call) else None for call in calls]))
+    return engine
+
+
+if __name__ == "__main__":
+    ts = str(datetime.datetime.now())
+    ver = "someversion"
+    scriptName = sys.argv[0]
+    cmdString = " ".join(sys.argv)
+    args = get_args()
+    with open_vcf(args.haplotypecaller, "auto", args.io_threads) as hc, open_vcf(
+        args.deepvariant, "auto", args.io_threads
+    ) as dv, open_vcf(args.strelka2, "auto", args.io_threads) as strelka2, open_vcf_output(
+        args.outfile, args.output_type, args.io_threads
+    ) as out:
+        harmonize([iter(hc), iter(dv), iter(strelka2)], out, ts, ver, scriptName, cmdString)
@@ -1,8 +1,28 @@
 #!/usr/bin/env python3
 
 import argparse
+import gzip
+import numpy as np
 import pandas as pd
 import os
+import sys
+
+from annotation_tables import CSV_ENGINES, read_options, read_table
+
+# rows per read_csv chunk in --partition-by-chrom mode
+CHUNK_ROWS = 200000
+# feature files written by save_by_feature, in the order of the feature class codes
+FEATURE_CLASSES = ['gene', 'ncRNA', 'intergenic', 'intronic']
+PROTEIN_FEATURES = ['UTR', 'exonic', 'splicing', 'upstream', 'downstream']
+OUTPUT_FORMATS = ['tsv', 'tsv.gz', 'parquet']
+# typed Parquet output: float columns besides gnomAD_genomes_AF*, and the partition columns
+FLOAT_COLUMNS = ['InterVar.PVS1']
+PARTITION_COLUMNS = ['CHROM', 'feature_class']
+# ANNOVAR / parse_intervar.py output columns read by merge_annotations, with their dtypes
+MERGE_DTYPES = {'Chr': str, 'Start': 'int64', 'End': 'int64', 'Ref': str, 'Alt': str}
+PARSED_INTERVAR_DTYPES = {'#Chr': str, 'Start': 'int64', 'End': 'int64', 'Ref': str, 'Alt': str, 'InterVar.significance': str, 'InterVar.PVS1': 'float64'}
+# gnomAD genome allele frequencies kept from ANNOVAR: overall and per population group
+GNOMAD_AF_COLUMNS = ['AF', 'AF_afr', 'AF_ami', 'AF_amr', 'AF_asj', 'AF_eas', 'AF_fin', 'AF_mid', 'AF_nfe', 'AF_oth', 'AF_sas']
 
 def classify_variant_type(ref, alt):
     """Classifiy the variant type based on length of reference and alternate nucleotides
@@ -32,6 +52,42 @@ def classify_variant_type(ref, alt):
         return 'ONP'
 
 
+def classify_variant_types(ref, alt):
+    """Vectorized classify_variant_type over REF/ALT string columns
+
+    Args:
+        ref (Series): reference nucleotides of the variants
+        alt (Series): alternate nucleotides of the variants
+
+    Returns:
+        ndarray: variant type classification of each variant, NaN where REF or ALT
+            is missing (ANNOVAR or InterVar rows without a snpEff record)
+    """
+    ref_len = ref.str.len()
+    alt_len = alt.str.len()
+    conditions = [
+        alt_len > ref_len,
+        alt_len < ref_len,
+        (ref_len == 1) & (alt_len == 1),
+        (ref_len == 2) & (alt_len == 2),
+        (ref_len == 3) & (alt_len == 3),
+    ]
+    variant_types = np.select(conditions, ['INS', 'DEL', 'SNP', 'DNP', 'TNP'], default='ONP').astype(object)
+    variant_types[(ref.isna() | alt.isna()).to_numpy()] = np.nan
+    return variant_types
+
+
+def variant_ids(chrom, pos, ref, alt):
+    """Join key CHROM_POS_REF_ALT of each variant, built column-wise"""
+    return chrom.astype(str) + '_' + pos.astype(str) + '_' + ref.astype(str) + '_' + alt.astype(str)
+
+
+def annovar_ids(annotations):
+    """Join key of ANNOVAR/InterVar rows: deletions are keyed on Start, SNPs and insertions on End"""
+    deletion = annotations['Ref'].str.len() > annotations['Alt'].str.len()
+    pos = pd.Series(np.where(deletion, annotations['Start'], annotations['End']), index=annotations.index)
+    return variant_ids(annotations['Chr'], pos, annotations['Ref'], annotations['Alt'])
+
 
 def merge_annotations(annovar, intervar, snpeff):
     """Merge annotations into single dataframe
@@ -41,21 +97,10 @@ def merge_annotations(annovar, intervar, snpeff):
         intervar (DataFrame): intervar data, relevant information extracted beforehand
         snpeff (DataFrame): SnpEff data, relevant information extracted beforehand
     """
-
-    def get_annovar_id(row):
-        # IF DELETION
-        if len(row['Ref']) > len(row['Alt']):
-            return f"{row['Chr']}_{row['Start']}_{row['Ref']}_{row['Alt']}"
-        # IF SNP, INSERTION
-        else:
-            return f"{row['Chr']}_{row['End']}_{row['Ref']}_{row['Alt']}"
-    def get_snpeff_id(row):
-        return f"{row['CHROM']}_{row['POS']}_{row['REF']}_{row['ALT']}"    
-
-    annovar['UID'] = annovar.apply(get_annovar_id, axis = 1)
-    intervar['Chr'] = intervar['#Chr'].apply(lambda x: "chr" + str(x))
+    annovar['UID'] = annovar_ids(annovar)
+    intervar['Chr'] = "chr" + intervar['#Chr'].astype(str)
     intervar.drop(columns=['#Chr'], inplace=True)
-    intervar['UID'] = intervar.apply(get_annovar_id, axis = 1)
+    intervar['UID'] = annovar_ids(intervar)
     intervar_cols = ['UID', 'InterVar.significance', 'InterVar.PVS1']
     # intervar_cols = list(set(intervar.columns) - set(annovar.columns))
     # intervar_cols.append('UID')
@@ -64,11 +109,11 @@ def merge_annotations(annovar, intervar, snpeff):
     merged.drop(columns = ['Chr', 'Start', 'End', 'Ref', 'Alt'], inplace=True)
 
 
-    snpeff['UID'] = snpeff.apply(get_snpeff_id, axis = 1)
+    snpeff['UID'] = variant_ids(snpeff['CHROM'], snpeff['POS'], snpeff['REF'], snpeff['ALT'])
 
     merged= snpeff.merge(merged, how = 'outer', on='UID')
     merged.drop('UID', axis=1, inplace=True)
-    variant_type = merged.apply(lambda row: classify_variant_type(row['REF'], row['ALT']), axis = 1)
+    variant_type = classify_variant_types(merged['REF'], merged['ALT'])
     merged.insert(8, 'VariantType', variant_type)
     # merged['POS'] = merged['POS'].astype(str).astype(int)
 
@@ -76,7 +121,170 @@ def merge_annotations(annovar, intervar, snpeff):
     return merged
 
 
-def save_by_feature(merged, name, odir):
+def classify_feature(func):
+    """Feature class of a Func.refGene value, see save_by_feature
+
+    Args:
+        func (str): Func.refGene value
+
+    Returns:
+        str: one of FEATURE_CLASSES, or None if the variant goes to none of the feature files
+    """
+    if 'ncRNA' in func:
+        return 'ncRNA'
+    if any(feature in func for feature in PROTEIN_FEATURES):
+        return 'gene'
+    if func in ('intergenic', 'intronic'):
+        return func
+    return None
+
+
+def feature_classes(func):
+    """Categorical feature class of each Func.refGene value. Each distinct value is
+    classified once, so the column is scanned a single time.
+
+    Args:
+        func (Series): Func.refGene column
+
+    Returns:
+        Categorical: feature class of each variant (NaN if none)
+    """
+    classes = {value: classify_feature(value) for value in func.dropna().unique()}
+    return pd.Categorical(func.map(classes), categories=FEATURE_CLASSES)
+
+
+class TsvWriter:
+    """Appends DataFrames to a TSV (gzip compressed if compress), header line first"""
+
+    def __init__(self, filename, compress=False):
+        self.handle = gzip.open(filename, 'wt') if compress else open(filename, 'w')
+        self.header = True
+
+    def write(self, frame):
+        frame.to_csv(self.handle, sep='\t', index=False, header=self.header, chunksize=CHUNK_ROWS)
+        self.header = False
+
+    def close(self):
+        self.handle.close()
+
+
+class ParquetWriter:
+    """Appends DataFrames to a table of an on-disk duckdb database and exports it as
+    Parquet on close, so the rows need not all be held in memory. With partition_by the
+    export is a hive partitioned dataset directory (column=value subdirectories).
+    """
+
+    def __init__(self, filename, partition_by=()):
+        try:
+            import duckdb
+        except ImportError:
+            sys.exit('ERROR: Parquet output requires duckdb to be installed')
+        self.filename = filename
+        self.partition_by = partition_by
+        self.database = filename + '.duckdb'
+        for path in (self.database, self.database + '.wal'):
+            if os.path.exists(path):
+                os.remove(path)
+        self.connection = duckdb.connect(self.database)
+        self.created = False
+
+    def write(self, frame):
+        # text columns are VARCHAR even if a chunk has no values to infer the type from
+        columns = ', '.join(
+            f'CAST("{column}" AS VARCHAR) AS "{column}"' if frame[column].dtype == object else f'"{column}"'
+            for column in frame.columns
+        )
+        self.connection.register('frame', frame)
+        if self.created:
+            self.connection.execute(f'INSERT INTO rows SELECT {columns} FROM frame')
+        else:
+            self.connection.execute(f'CREATE TABLE rows AS SELECT {columns} FROM frame')
+            self.created = True
+        self.connection.unregister('frame')
+
+    def close(self):
+        options = 'FORMAT PARQUET'
+        if self.partition_by:
+            options += ', PARTITION_BY ({}), OVERWRITE_OR_IGNORE'.format(', '.join(f'"{column}"' for column in self.partition_by))
+        self.connection.execute(f"COPY rows TO '{self.filename}' ({options})")
+        self.connection.close()
+        os.remove(self.database)
+
+
+def typed_annotations(merged):
+    """Merged annotations with the Parquet column types and the feature_class column
+
+    POS becomes a nullable integer, the gnomAD_genomes_AF* and InterVar.PVS1 columns
+    floats ('.' is missing). CHROM, VariantType, Func.refGene and feature_class stay
+    strings, which Parquet stores dictionary encoded; CHROM and feature_class are the
+    partition directories of the dataset.
+
+    Args:
+        merged (DataFrame): merged variant annotations
+
+    Returns:
+        DataFrame: typed copy of merged
+    """
+    columns = {'POS': pd.to_numeric(merged['POS']).astype('Int64')}
+    for column in merged.columns:
+        if column in FLOAT_COLUMNS or column.startswith('gnomAD_genomes_AF'):
+            columns[column] = pd.to_numeric(merged[column], errors='coerce').astype(float)
+    columns['feature_class'] = np.asarray(feature_classes(merged['Func.refGene']), dtype=object)
+    return merged.assign(**columns)
+
+
+class FeatureWriter:
+    """Writes merged annotations to the four feature TSVs at once, see save_by_feature.
+    The files stay open, so the merged table can be written a chunk at a time.
+    """
+
+    def __init__(self, name, odir, output_format='tsv'):
+        self.writers = [
+            TsvWriter(os.path.join(odir, f"{name}_annotated.{feature}.{output_format}"), compress=output_format == 'tsv.gz')
+            for feature in FEATURE_CLASSES
+        ]
+
+    def write(self, merged):
+        codes = feature_classes(merged['Func.refGene']).codes
+        for code, writer in enumerate(self.writers):
+            writer.write(merged[codes == code])
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
+
+
+class AnnotationWriter:
+    """Writes the merged annotations in output_format, a chunk (e.g. a chromosome) at a time
+
+    tsv, tsv.gz: {name}_merged_annotations.tsv[.gz] and the four feature files
+    parquet: typed dataset {name}_merged_annotations.parquet/CHROM=.../feature_class=.../*.parquet,
+        where the feature files are the feature_class partitions
+    """
+
+    def __init__(self, name, odir, output_format='tsv'):
+        prefix = os.path.join(odir, f"{name}_merged_annotations")
+        self.typed = output_format == 'parquet'
+        if self.typed:
+            self.writers = [ParquetWriter(f"{prefix}.parquet", partition_by=PARTITION_COLUMNS)]
+        else:
+            self.writers = [
+                TsvWriter(f"{prefix}.{output_format}", compress=output_format == 'tsv.gz'),
+                FeatureWriter(name, odir, output_format),
+            ]
+
+    def write(self, merged):
+        if self.typed:
+            merged = typed_annotations(merged)
+        for writer in self.writers:
+            writer.write(merged)
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
+
+
+def save_by_feature(merged, name, odir, output_format='tsv'):
     """Separate the data based on feature and save each feature set individually.
 
     gene: UTR, exonic, splicing, upstream, downstream
@@ -89,22 +297,160 @@ def save_by_feature(merged, name, odir):
         merged (DataFrame): merged variant annotations
         name (str): prepended name used in file naming
         odir (str): output directory
+        output_format (str): tsv or tsv.gz
     """
-    
-    merged_nona = merged[merged['Func.refGene'].notna()]
-    not_ncrna = merged_nona[~merged_nona['Func.refGene'].str.contains('ncRNA')]
+    writer = FeatureWriter(name, odir, output_format)
+    writer.write(merged)
+    writer.close()
+
+
+def rename_gnomad_columns(annovar):
+    """Prefix the ANNOVAR gnomAD allele frequency columns (AF*) with gnomAD_genomes_"""
+    gnomad_map = {c: 'gnomAD_genomes_' + c for c in annovar.columns if c.startswith('AF')}
+    annovar.rename(columns = gnomad_map, inplace=True)
+
+
+def keep_rs_ids(snpeff):
+    """Keep only dbSNP rs IDs in the snpEff ID column"""
+    snpeff['ID'] = snpeff['ID'].where(snpeff['ID'].str.startswith('rs', na=False), '.')
+
+
+def annovar_dtypes(filename, gnomad_af=GNOMAD_AF_COLUMNS):
+    """Columns read from an ANNOVAR multianno table and their dtypes
+
+    The merge columns and the gene, ClinVar and cytoBand annotations as text, the
+    gnomad_af allele frequency columns (None for every AF* column) as floats. The
+    Otherinfo columns (avinput pass-through) are not read.
+
+    Args:
+        filename (str): ANNOVAR multianno table
+        gnomad_af (list): gnomAD AF columns to keep, or None for all of them
+
+    Returns:
+        dict: column -> dtype, in file order
+    """
+    dtypes = {}
+    for column in pd.read_csv(filename, sep = '\t', nrows=0).columns:
+        if column.startswith('Otherinfo'):
+            continue
+        if column.startswith('AF'):
+            if gnomad_af is None or column in gnomad_af:
+                dtypes[column] = 'float64'
+        else:
+            dtypes[column] = MERGE_DTYPES.get(column, str)
+    return dtypes
+
 
-    protein_features = ['UTR', 'exonic','splicing', 'upstream', 'downstream']
-    merged_protein = not_ncrna[not_ncrna['Func.refGene'].str.contains('|'.join(protein_features))]
+def read_annovar(filename, gnomad_af=GNOMAD_AF_COLUMNS, engine='c'):
+    """ANNOVAR multianno table with the annovar_dtypes columns, gnomAD AF columns renamed"""
+    annovar = read_table(filename, annovar_dtypes(filename, gnomad_af), engine)
+    rename_gnomad_columns(annovar)
+    return annovar
 
-    ncrna = merged_nona[merged_nona['Func.refGene'].str.contains('ncRNA')]
-    intergenic = not_ncrna[not_ncrna['Func.refGene'] == 'intergenic']
-    intronic = not_ncrna[not_ncrna['Func.refGene'] == 'intronic']
 
-    merged_protein.to_csv(os.path.join(odir, f"{name}_annotated.gene.tsv"), sep = '\t', index=False)
-    ncrna.to_csv(os.path.join(odir, f"{name}_annotated.ncRNA.tsv"), sep = '\t', index=False)
-    intergenic.to_csv(os.path.join(odir, f"{name}_annotated.intergenic.tsv"), sep = '\t', index=False)
-    intronic.to_csv(os.path.join(odir, f"{name}_annotated.intronic.tsv"), sep = '\t', index=False)
+def read_intervar(filename, engine='c'):
+    """parse_intervar.py output, only the columns merge_annotations uses"""
+    return read_table(filename, PARSED_INTERVAR_DTYPES, engine)
+
+
+def chromosome_frames(chunks, column, prefix=''):
+    """Regroup the chunks of a chromosome-sorted table into one DataFrame per chromosome
+
+    Args:
+        chunks (iterable): DataFrame chunks of the table, in file order
+        column (str): chromosome column
+        prefix (str): prepended to the column values to give the chromosome name
+
+    Yields:
+        (str, DataFrame): chromosome name and all of its rows
+    """
+    seen = set()
+    current = None
+    parts = []
+    for chunk in chunks:
+        chroms = prefix + chunk[column].astype(str)
+        starts = np.flatnonzero((chroms != chroms.shift()).to_numpy())
+        for start, end in zip(starts, list(starts[1:]) + [len(chunk)]):
+            chrom = chroms.iat[start]
+            if chrom == current:
+                parts.append(chunk.iloc[start:end])
+                continue
+            if chrom in seen:
+                sys.exit(f"ERROR: {column} {chrom} is not contiguous; inputs must be sorted by chromosome")
+            if parts:
+                yield current, pd.concat(parts, ignore_index=True)
+            seen.add(chrom)
+            current = chrom
+            parts = [chunk.iloc[start:end]]
+    if parts:
+        yield current, pd.concat(parts, ignore_index=True)
+
+
+def read_chromosomes(filename, column, prefix='', chunk_rows=CHUNK_ROWS, dtypes=None):
+    """Column names of a TSV and an iterator of its per chromosome DataFrames
+
+    dtypes: columns to read and their dtypes, see read_options (default: all columns as text)
+    """
+    if dtypes is None:
+        columns = pd.read_csv(filename, sep = '\t', nrows=0).columns
+        chunks = pd.read_csv(filename, sep = '\t', dtype=object, chunksize=chunk_rows)
+    else:
+        columns = list(dtypes)
+        chunks = pd.read_csv(filename, sep = '\t', chunksize=chunk_rows, **read_options(dtypes))
+    return columns, chromosome_frames(chunks, column, prefix)
+
+
+def chromosome_partitions(annovar_filename, intervar_filename, snpeff_filename, chunk_rows=CHUNK_ROWS, prune_columns=False, gnomad_af=GNOMAD_AF_COLUMNS):
+    """Yield (chromosome, annovar, intervar, snpeff) DataFrames, one chromosome at a time
+
+    The three tables must list their chromosomes in the same order. snpEff output written
+    with --write-unannotated has every variant, so its chromosomes drive the iteration;
+    a chromosome missing from ANNOVAR or InterVar gets an empty table. With prune_columns
+    ANNOVAR and InterVar are read with the columns and dtypes of read_annovar / read_intervar.
+    """
+    sources = [
+        read_chromosomes(snpeff_filename, 'CHROM', chunk_rows=chunk_rows),
+        read_chromosomes(annovar_filename, 'Chr', chunk_rows=chunk_rows, dtypes=annovar_dtypes(annovar_filename, gnomad_af) if prune_columns else None),
+        read_chromosomes(intervar_filename, '#Chr', prefix='chr', chunk_rows=chunk_rows, dtypes=PARSED_INTERVAR_DTYPES if prune_columns else None),
+    ]
+    heads = [next(frames, None) for _, frames in sources]
+    if all(head is None for head in heads):
+        # no rows: one empty partition, so the output files still get their header
+        snpeff, annovar, intervar = (pd.DataFrame(columns=columns, dtype=object) for columns, _ in sources)
+        yield None, annovar, intervar, snpeff
+    done = set()
+    while any(head is not None for head in heads):
+        chrom = next(head[0] for head in heads if head is not None)
+        tables = []
+        for i, (columns, frames) in enumerate(sources):
+            if heads[i] is not None and heads[i][0] == chrom:
+                tables.append(heads[i][1])
+                heads[i] = next(frames, None)
+            else:
+                tables.append(pd.DataFrame(columns=columns, dtype=object))
+        done.add(chrom)
+        for head in heads:
+            if head is not None and head[0] in done:
+                sys.exit(f"ERROR: chromosome {head[0]} is out of order; inputs must list chromosomes in the same order")
+        snpeff, annovar, intervar = tables
+        yield chrom, annovar, intervar, snpeff
+
+
+def merge_by_chromosome(annovar_filename, intervar_filename, snpeff_filename, name, odir, chunk_rows=CHUNK_ROWS, output_format='tsv',
+                        prune_columns=False, gnomad_af=GNOMAD_AF_COLUMNS):
+    """Out-of-core merge_annotations: merge one chromosome at a time and append the
+    rows to the merged and per feature files, so peak memory is bounded by the largest
+    chromosome rather than the whole table. Values are passed through as text, as in the
+    whole-file merge, or with prune_columns ANNOVAR and InterVar are read as read_annovar /
+    read_intervar do.
+    """
+    writer = AnnotationWriter(name, odir, output_format)
+    for chrom, annovar, intervar, snpeff in chromosome_partitions(annovar_filename, intervar_filename, snpeff_filename, chunk_rows, prune_columns, gnomad_af):
+        rename_gnomad_columns(annovar)
+        keep_rs_ids(snpeff)
+        merged = merge_annotations(annovar, intervar, snpeff)
+        writer.write(merged)
+    writer.close()
 
 
 def parse_args():
@@ -114,23 +460,41 @@ def parse_args():
     parser.add_argument('--snpeff', action='store', dest='snpeff', help='SnpEff output, with effect extraction. TSV format')
     parser.add_argument("--name", action="store", help="name of sample. Used in naming files")
     parser.add_argument("-odir",  help="Output directory to save files to")
+    parser.add_argument('--partition-by-chrom', action='store_true', dest='partition_by_chrom', help='Merge one chromosome at a time, appending to the output files. Inputs must be sorted by chromosome in the same order')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, dest='chunk_rows', help=f'Rows read per chunk with --partition-by-chrom (default: {CHUNK_ROWS})')
+    parser.add_argument('--prune-columns', action='store_true', dest='prune_columns', help='Read only the ANNOVAR and InterVar columns merged, with typed gnomAD AFs. Changes the output: the Otherinfo columns and the AF columns not in --gnomad-af are dropped, and missing AFs are written as empty fields instead of "."')
+    parser.add_argument('--gnomad-af', nargs='+', default=None, dest='gnomad_af', help='gnomAD AF columns of the ANNOVAR table kept with --prune-columns, or "all" (default: {})'.format(' '.join(GNOMAD_AF_COLUMNS)))
+    parser.add_argument('--csv-engine', choices=CSV_ENGINES, default='c', dest='csv_engine', help='read_csv engine for the ANNOVAR and InterVar tables with --prune-columns; pyarrow needs pyarrow installed and is not used with --partition-by-chrom (default: c)')
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='tsv', dest='output_format', help='Format of the merged and feature files: tsv, gzip compressed tsv, or a typed Parquet dataset partitioned by CHROM and feature_class (needs duckdb). Default: tsv')
     args = parser.parse_args()
+    if not args.prune_columns and (args.gnomad_af is not None or args.csv_engine != 'c'):
+        parser.error('--gnomad-af and --csv-engine apply with --prune-columns only')
+    if args.gnomad_af is None:
+        args.gnomad_af = GNOMAD_AF_COLUMNS
+    elif args.gnomad_af == ['all']:
+        args.gnomad_af = None
     return args
 
 if __name__=="__main__":
     args = parse_args()
-    annovar = pd.read_csv(args.annovar, sep = '\t')
-    gnomad_cols = [c for c in annovar.columns if c.startswith('AF')]
-    gnomad_map = {}
-    for c in gnomad_cols:
-        gnomad_map[c] = 'gnomAD_genomes_' + c
-    annovar.rename(columns = gnomad_map, inplace=True)
-    intervar = pd.read_csv(args.intervar, sep = '\t')
-    snpeff = pd.read_csv(args.snpeff, dtype=object, sep = '\t')
+    if args.partition_by_chrom:
+        merge_by_chromosome(args.annovar, args.intervar, args.snpeff, args.name, args.odir, args.chunk_rows, args.output_format,
+                            args.prune_columns, args.gnomad_af)
+    else:
+        if args.prune_columns:
+            annovar = read_annovar(args.annovar, args.gnomad_af, args.csv_engine)
+            intervar = read_intervar(args.intervar, args.csv_engine)
+        else:
+            # values as text, as --partition-by-chrom reads them: an outer merge of
+            # inferred int64 columns would write them as floats (10.0)
+            annovar = pd.read_csv(args.annovar, dtype=object, sep = '\t')
+            rename_gnomad_columns(annovar)
+            intervar = pd.read_csv(args.intervar, dtype=object, sep = '\t')
+        snpeff = pd.read_csv(args.snpeff, dtype=object, sep = '\t')
 
-    snpeff['ID'] = snpeff['ID'].apply(lambda x: x if x.startswith('rs') else '.')
+        keep_rs_ids(snpeff)
     
-    merged = merge_annotations(annovar, intervar, snpeff)
-    outfile = os.path.join(args.odir, f"{args.name}.merged_annotations.tsv")
-    merged.to_csv(f"{args.odir}/{args.name}_merged_annotations.tsv",  sep='\t', index=False)
-    save_by_feature(merged, args.name, args.odir)
\ No newline at end of file
+        merged = merge_annotations(annovar, intervar, snpeff)
+        writer = AnnotationWriter(args.name, args.odir, args.output_format)
+        writer.write(merged)
+        writer.close()
\ No newline at end of file
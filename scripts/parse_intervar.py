@@ -5,27 +5,75 @@ import pandas as pd
 import numpy as np
 import re 
 
+from annotation_tables import CSV_ENGINES, read_table
+
+SIG_COL = ' InterVar: InterVar and Evidence '
+# columns of InterVar's .intervar table used here, with their dtypes
+INTERVAR_TABLE_DTYPES = {'#Chr': str, 'Start': 'int64', 'End': 'int64', 'Ref': str, 'Alt': str, SIG_COL: str}
+
+# ACMG evidence codes in InterVar's order: single codes, or a list prefix and its number of
+# criteria. InterVar writes each list with one more slot than there are criteria.
+ACMG_EVIDENCE = [('PVS1', None), ('PS', 4), ('PM', 6), ('PP', 5), ('BA1', None), ('BS', 4), ('BP', 7)]
+
+
+def evidence_pattern():
+    """One regex for the InterVar evidence string: a significance group and a named group
+    per ACMG evidence code. Each code is optional, so a truncated string still yields the
+    codes it has.
+    """
+    parts = [r'InterVar:\s*(?P<significance>.*?)\s*(?=PVS1|$)']
+    for name, count in ACMG_EVIDENCE:
+        if count is None:
+            parts.append(rf'(?:.*?{name}=(?P<{name}>\d+))?')
+        else:
+            codes = r'\s*,\s*'.join(rf'(?P<{name}{i}>\d+)' for i in range(1, count + 1))
+            parts.append(rf'(?:.*?{name}=\[{codes}(?:\s*,\s*\d+)*\])?')
+    return re.compile(''.join(parts))
+
+EVIDENCE_PATTERN = evidence_pattern()
+
 def extract_significance(intervar_info):
     significance = intervar_info.strip('InterVar: ').split('PVS1')[0].strip()
     return significance
 
 def extract_PVS1(intervar_info):
-    match = re.search('PVS1=(\d+)', intervar_info)
+    match = re.search(r'PVS1=(\d+)', intervar_info)
     if match:
         pvs1 = match.group(1)
         return float(pvs1)
     else:
         return np.nan
 
-def parse_intervar(intervar_filename):
-    intervar = pd.read_csv(intervar_filename, sep = '\t')
-    sig_col = ' InterVar: InterVar and Evidence '
+def extract_evidence(evidence):
+    """InterVar.significance and one nullable integer InterVar.<code> column per ACMG
+    evidence code, in one str.extract pass
+
+    Args:
+        evidence (Series): the ' InterVar: InterVar and Evidence ' column
 
+    Returns:
+        DataFrame: InterVar.significance, InterVar.PVS1, InterVar.PS1, ..., InterVar.BP7
+    """
+    extracted = evidence.str.extract(EVIDENCE_PATTERN)
+    codes = extracted.drop(columns='significance').astype('Int8')
+    codes.columns = ['InterVar.' + code for code in codes.columns]
+    codes.insert(0, 'InterVar.significance', extracted['significance'])
+    return codes
 
-    intervar['InterVar.significance'] = intervar[sig_col].apply(extract_significance)
-    intervar['InterVar.PVS1'] = intervar[sig_col].apply(extract_PVS1)
+def parse_intervar(intervar_filename, engine='c', all_evidence=False):
+    intervar = read_table(intervar_filename, INTERVAR_TABLE_DTYPES, engine)
+    sig_col = SIG_COL
+
+    if all_evidence:
+        evidence = extract_evidence(intervar[sig_col])
+        # same 0.0/1.0 format as the default InterVar.PVS1 column
+        evidence['InterVar.PVS1'] = evidence['InterVar.PVS1'].astype('float64')
+        intervar = pd.concat([intervar[['#Chr', 'Start','End', 'Ref', 'Alt', sig_col]], evidence], axis=1)
+    else:
+        intervar['InterVar.significance'] = intervar[sig_col].apply(extract_significance)
+        intervar['InterVar.PVS1'] = intervar[sig_col].apply(extract_PVS1)
 
-    intervar = intervar[['#Chr', 'Start','End', 'Ref', 'Alt', sig_col, 'InterVar.significance', 'InterVar.PVS1']]
+        intervar = intervar[['#Chr', 'Start','End', 'Ref', 'Alt', sig_col, 'InterVar.significance', 'InterVar.PVS1']]
     intervar.rename(columns = {sig_col: sig_col.strip()}, inplace=True)
     intervar.drop_duplicates(inplace=True)
     # intervar.rename(columns = {'#Chr': 'CHROM', 'Start': 'POS', 'Ref': 'REF', 'Alt': 'ALT'}, inplace=True)
@@ -35,12 +83,14 @@ def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('--intervar', action='store', dest='intervar')
     parser.add_argument('--output', action='store', dest='output')
+    parser.add_argument('--csv-engine', choices=CSV_ENGINES, default='c', dest='csv_engine', help='read_csv engine; pyarrow needs pyarrow installed (default: c)')
+    parser.add_argument('--all-evidence', action='store_true', dest='all_evidence', help='Also write every ACMG evidence code (InterVar.PS1 ... InterVar.BP7) as an integer column')
     args = parser.parse_args()
     return args
 
 def main():
     args = parse_args()
-    parsed_intervar = parse_intervar(args.intervar)
+    parsed_intervar = parse_intervar(args.intervar, args.csv_engine, args.all_evidence)
     parsed_intervar.to_csv(args.output, sep = '\t', index=False)
 
 if __name__=="__main__":
@@ -1,126 +1,81 @@
 #!/usr/bin/env python3
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 from contextlib import contextmanager
-from collections import defaultdict
+from collections import OrderedDict, deque
+import io
+import os
 import sys
 
+from vcf_io import BCF_MAGIC, GZIP_MAGIC
 
-class SnpEffANNSubField:
-    """Parsed data of a single SnpEff ANN entry
-    Details for each sub-field can be found in SnpEff documentation
-    https://pcingola.github.io/SnpEff/se_inputoutput/ 
+
+IMPACTS = ('MODIFIER', 'LOW', 'MODERATE', 'HIGH')
+IMPACT_LEVELS = {impact: level for level, impact in enumerate(IMPACTS)}
+OUTPUT_HEADER = 'CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tset\tANN\thighest_impact\tnum_impact_transcripts\ttotal_transcripts\tHGVS.c\tHGVS.p\teffect\tSnpEffGene\n'
+UNANNOTATED = '\t.' * 8
+CHUNK_BYTES = 8 * 1024 * 1024
+ANN_CACHE_SIZE = 4096
+RECORD_BATCH = 10000
+# bcftools query columns taken from the INFO of a VCF/BCF input
+INFO_KEYS = ('set', 'ANN')
+
+
+def summarize_ann(annotation):
+    """Output columns for a raw ANN value, as the SnpEffField object computed them:
+    (ANN, highest_impact, num_impact_transcripts, total_transcripts, HGVS.c, HGVS.p, effect, SnpEffGene)
+
+    Each transcript entry is tokenized with a single split, keeping only the
+    annotation (1), impact (2), gene name (3), HGVS.c (9) and HGVS.p (10) sub-fields.
+    Genes are sorted, where SnpEffField joined them in set order.
     """
-    def __init__(self, annotation_subfield):
-        self.raw_annotation = annotation_subfield.strip('ANN=')
-
-
-        split_annotaion = self.raw_annotation.split('|')
-        self.allele = split_annotaion[0].strip('ANN=')
-        self.annotation = split_annotaion[1]
-        self.putative_impact = split_annotaion[2]
-        self.gene_name = split_annotaion[3]
-        self.gene_id = split_annotaion[4]
-        self.feature_type = split_annotaion[5]
-        self.feature_id = split_annotaion[6]
-        self.transcript_biotype = split_annotaion[7]
-        self.rank__total = split_annotaion[8]
-        self.hgvs_c = split_annotaion[9]
-        self.hgvs_p = split_annotaion[10]
-        self.cdna_position__cdna_length = split_annotaion[11]
-        self.cds_position__cds_length = split_annotaion[12]
-        self.protein_position__protein_length = split_annotaion[13]
-        self.distance_to_feature = split_annotaion[14]
-        self.errors = split_annotaion[15]
-
-    def __repr__(self) -> str:
-        return self.raw_annotation
-    def __str__(self) -> str:
-        return self.raw_annotation
-    
-    def is_high_impact(self):
-        return self.putative_impact in ('MODERATE', 'HIGH')
-
-
-class SnpEffField:
-    def __init__(self, annotation):
-        self.annotation = annotation.strip('ANN=')
-        split_annotation = self.annotation.split(',')
-        self.subfield_dict = defaultdict(list)
-        for annot in split_annotation:
-            subfield = SnpEffANNSubField(annot)
-            self.subfield_dict[subfield.putative_impact].append(subfield)
-        # self.subfields = [SnpEffANNSubField(x) for x in split_annotation]
-        self.highest_impact = self.find_highest_impact()
-    
-    def __repr__(self) -> str:
-        return self.annotation
+    annotation = annotation.strip('ANN=')
+    entries = annotation.split(',')
+    highest = 0
+    selected = []
+    for entry in entries:
+        fields = entry.split('|', 11)
+        level = IMPACT_LEVELS[fields[2]]
+        if level > highest:
+            highest = level
+            selected = [fields]
+        elif level == highest:
+            selected.append(fields)
+    return (
+        annotation,
+        IMPACTS[highest],
+        str(len(selected)),
+        str(len(entries)),
+        ';'.join([fields[9] for fields in selected if fields[9] != '']) or '.',
+        ';'.join([fields[10] for fields in selected if fields[10] != '']) or '.',
+        ';'.join(sorted({fields[1] for fields in selected})) or '.',
+        ';'.join(sorted({fields[3] for fields in selected if fields[3] != ''})),
+    )
 
-    @property
-    def gene(self):
-        gene_set = set([subfield.gene_name for subfield in self.subfield_dict[self.highest_impact] if subfield.gene_name != ''])
-        return ';'.join(gene_set)
-    
-    def find_highest_impact(self):
-        impact_levels = {'MODIFIER': 0, 'LOW': 1, 'MODERATE': 2, 'HIGH': 3}
-        current_impact_level = 'MODIFIER'
-        for impact in self.subfield_dict.keys():
-            if impact_levels[impact] > impact_levels[current_impact_level]:
-                current_impact_level = impact
-        return current_impact_level
-    
-    @property
-    def hgvs_c(self):
-        
-        hgvs_c = [subfield.hgvs_c for subfield in self.subfield_dict[self.highest_impact] if subfield.hgvs_c != '']
-        
-        if len(hgvs_c) > 0:
-            return ';'.join(hgvs_c)
-        else:
-            return '.'
-    
-    @property
-    def hgvs_p(self):
-        hgvs_p = [subfield.hgvs_p for subfield in self.subfield_dict[self.highest_impact] if subfield.hgvs_p != '']
-        if len(hgvs_p) > 0:
-            return ';'.join(hgvs_p)
-        else:
-            return '.'
-    
-    @property
-    def effect(self):
-        effect = [subfield.annotation for subfield in self.subfield_dict[self.highest_impact]]
-        effect = list(set(effect))
-        effect.sort()
-        if len(effect) > 0:
-            return ';'.join(effect)
-        else:
-            return '.'
-
-        
-    @property
-    def num_impact_transcripts(self):
-        return len(self.subfield_dict[self.highest_impact])
-        # total = 0
-        # for sub in self.subfields:
-        #     if sub.is_high_impact():
-        #         total = total + 1
-        # return total
-    
-    @property
-    def is_classic_high_impact(self):      
-        classic_high_impact_classifications = ['frameshift_variant', 'stop_gained','stop_lost','start_lost','splice_acceptor_variant','splice_donor_variant']
-        if self.highest_impact == 'HIGH' and any(x in self.effect for x in classic_high_impact_classifications):
-            return 'Y'
-        return 'N'
-        
-
-    @property
-    def total_transcripts(self):
-        total = 0
-        for impact, transcripts in self.subfield_dict.items():
-            total = total + len(transcripts)
-        return total
+
+class AnnCache:
+    """LRU-bounded memo of raw ANN string -> summarize_ann output, with hit/miss counters.
+    Split multi-allelic records and neighbouring variants often carry the same ANN.
+    """
+
+    def __init__(self, maxsize=ANN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.summaries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, ann):
+        summary = self.summaries.get(ann)
+        if summary is not None:
+            self.hits += 1
+            self.summaries.move_to_end(ann)
+            return summary
+        self.misses += 1
+        summary = self.summaries[ann] = summarize_ann(ann)
+        if len(self.summaries) > self.maxsize:
+            self.summaries.popitem(last=False)
+        return summary
 
 
 @contextmanager
@@ -132,40 +87,189 @@ def file_or_stdout(file_name):
             yield out_file
 
 def parse_args():
-    parser = argparse.ArgumentParser("Parse snpEff tsv.  Breaks up annotation to determine highest impact and the number of transcripts that have a MEDIUM or HIGH impact. Annotation and set information should already be extracted using bcftools query")
+    parser = argparse.ArgumentParser("Parse snpEff tsv.  Breaks up annotation to determine highest impact and the number of transcripts that have a MEDIUM or HIGH impact. Input is either the annotation and set information extracted using bcftools query, or the snpEff annotated VCF/BCF itself")
     parser.add_argument('--include-header', dest='include_header',action='store_true', help='Include header column names')
     parser.add_argument('--write-unannotated', dest='write_unannotated',action='store_true', help='Include variants where no snpEff annotation exists')
-    parser.add_argument('infile', help='Input snpEff VCF file')
+    parser.add_argument('infile', help='Input bcftools query tsv or snpEff annotated VCF(.gz)/BCF file (detected from the content)')
     parser.add_argument("outfile", nargs='?', help="Output snpEff tsv filename. If not provided then output to stdout")
+    parser.add_argument('--threads', type=int, default=1, help='Number of worker processes parsing byte ranges (tsv) or batches of records (VCF/BCF) of the input (default: 1)')
+    parser.add_argument('--stats', action='store_true', help='Report the ANN summary cache hit rate on stderr')
     args = parser.parse_args()
-    return args.infile, args.outfile, args.include_header, args.write_unannotated
+    return args.infile, args.outfile, args.include_header, args.write_unannotated, args.threads, args.stats
+
+
+def parse_records(records, write_unannotated, cache):
+    """Yield the output line of every record, given as its bcftools query columns."""
+    for fields in records:
+        chrom, pos, id, ref, alt, qual, filt, set, ann = fields
+        if ann != '.':
+            yield '\t'.join(fields[:8]) + '\t' + '\t'.join(cache.get(ann)) + '\n'
+        elif write_unannotated:
+            yield '\t'.join(fields[:8]) + UNANNOTATED + '\n'
+
+
+def parse_lines(lines, write_unannotated, cache):
+    """Yield the output line of every record of the bcftools query TSV lines."""
+    records = (line.rstrip('\n').split('\t') for line in lines if not line.startswith('#'))
+    return parse_records(records, write_unannotated, cache)
+
+
+def is_vcf(infile):
+    """True if infile is a VCF/BCF (compressed, BCF or ##fileformat text) rather than a bcftools query TSV."""
+    with open(infile, 'rb') as ifile:
+        head = ifile.read(16)
+    return head[:2] == GZIP_MAGIC or head[:3] == BCF_MAGIC or head.startswith(b'##fileformat=VCF')
+
 
+def info_value(value):
+    """INFO value as bcftools query prints it."""
+    if value is None:
+        return '.'
+    if isinstance(value, tuple):
+        return ','.join('.' if v is None else str(v) for v in value)
+    return str(value)
 
-def parse_snpEff(infile, outfile, include_header, write_unannotated):
-    header = ''
-    with open(infile) as ifile, file_or_stdout(outfile) as ofile:
+
+def vcf_records(infile, threads=1):
+    """Yield the bcftools query columns (CHROM POS ID REF ALT QUAL FILTER INFO/set INFO/ANN)
+    of every record of a VCF/BCF. Read through pysam with the samples dropped, so no
+    genotype column is parsed.
+    """
+    try:
+        import pysam
+    except ImportError:
+        sys.exit('ERROR: reading VCF/BCF input requires pysam to be installed')
+    # streaming needs no index; keep htslib from warning that there is none
+    verbosity = pysam.set_verbosity(0)
+    try:
+        variant_file = pysam.VariantFile(infile, drop_samples=True, threads=threads)
+    finally:
+        pysam.set_verbosity(verbosity)
+    with variant_file:
+        info_keys = [key if key in variant_file.header.info else None for key in INFO_KEYS]
+        for record in variant_file:
+            info = record.info
+            yield (
+                record.chrom,
+                str(record.pos),
+                record.id or '.',
+                record.ref,
+                ','.join(record.alts) if record.alts else '.',
+                '.' if record.qual is None else '{:g}'.format(record.qual),
+                ';'.join(record.filter.keys()) or '.',
+            ) + tuple(info_value(info.get(key)) if key else '.' for key in info_keys)
+
+
+def record_batches(records, batch_size=RECORD_BATCH):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def chunk_ranges(infile, chunk_bytes=CHUNK_BYTES):
+    """(start, end) byte ranges of about chunk_bytes covering infile, each ending after a newline."""
+    size = os.path.getsize(infile)
+    with open(infile, 'rb') as ifile:
+        start = 0
+        while start < size:
+            ifile.seek(min(start + chunk_bytes, size))
+            ifile.readline()
+            end = min(ifile.tell(), size)
+            yield start, end
+            start = end
+
+
+# ANN cache of the worker processes of the --threads pool
+_worker_cache = None
+
+
+def _init_worker():
+    global _worker_cache
+    _worker_cache = AnnCache()
+
+
+def parse_range(infile, start, end, write_unannotated):
+    """Worker task: output lines of the byte range [start, end) of infile, as one string,
+    and the worker's cache hits and misses for the range.
+    """
+    with open(infile, 'rb') as ifile:
+        ifile.seek(start)
+        data = ifile.read(end - start)
+    hits, misses = _worker_cache.hits, _worker_cache.misses
+    # decoded like open(infile) in text mode: locale encoding, universal newlines
+    output = ''.join(parse_lines(io.TextIOWrapper(io.BytesIO(data)), write_unannotated, _worker_cache))
+    return output, _worker_cache.hits - hits, _worker_cache.misses - misses
+
+
+def parse_batch(records, write_unannotated):
+    """Worker task: output lines of a batch of VCF records (bcftools query columns),
+    with the worker's cache hits and misses for the batch.
+    """
+    hits, misses = _worker_cache.hits, _worker_cache.misses
+    output = ''.join(parse_records(records, write_unannotated, _worker_cache))
+    return output, _worker_cache.hits - hits, _worker_cache.misses - misses
+
+
+def parse_snpEff(infile, outfile, include_header, write_unannotated, threads=1):
+    """Stream the bcftools query TSV line by line, or the records of a snpEff annotated
+    VCF/BCF; memory use does not grow with the input. With threads > 1, byte ranges of
+    the TSV (batches of records of the VCF) are parsed by a process pool and written
+    back in input order. Returns the AnnCache (summed worker counters with threads > 1).
+    """
+    cache = AnnCache()
+    vcf_input = is_vcf(infile)
+    with file_or_stdout(outfile) as ofile:
         if include_header:
-            ofile.write('CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tset\tANN\thighest_impact\tnum_impact_transcripts\ttotal_transcripts\tHGVS.c\tHGVS.p\teffect\tSnpEffGene\n')
-        for line in ifile.readlines():
-            if line.startswith('#'):
-                # header = header + line
-                continue
+            ofile.write(OUTPUT_HEADER)
+        if threads <= 1:
+            if vcf_input:
+                ofile.writelines(parse_records(vcf_records(infile), write_unannotated, cache))
+            else:
+                with open(infile) as ifile:
+                    ofile.writelines(parse_lines(ifile, write_unannotated, cache))
+            return cache
+
+        def write_result(future):
+            output, hits, misses = future.result()
+            ofile.write(output)
+            cache.hits += hits
+            cache.misses += misses
+
+        with ProcessPoolExecutor(threads, initializer=_init_worker) as pool:
+            # bounded so the byte ranges are not all read ahead of the writer
+            if vcf_input:
+                tasks = ((parse_batch, batch, write_unannotated) for batch in record_batches(vcf_records(infile, threads)))
+            else:
+                tasks = ((parse_range, infile, start, end, write_unannotated) for start, end in chunk_ranges(infile))
+            pending = deque()
+            for task in tasks:
+                pending.append(pool.submit(*task))
+                while len(pending) > 2 * threads:
+                    write_result(pending.popleft())
+            while pending:
+                write_result(pending.popleft())
+    return cache
 
-            chrom, pos, id, ref, alt, qual, filt, set, ann = line.strip('\n').split('\t')
-            if ann != '.':
-                
-                ann =  SnpEffField(ann)
-                oline = f'{chrom}\t{pos}\t{id}\t{ref}\t{alt}\t{qual}\t{filt}\t{set}\t{ann}\t{ann.highest_impact}\t{ann.num_impact_transcripts}\t{ann.total_transcripts}\t{ann.hgvs_c}\t{ann.hgvs_p}\t{ann.effect}\t{ann.gene}\n'
-                ofile.write(oline)
-            elif write_unannotated:
-                oline = f'{chrom}\t{pos}\t{id}\t{ref}\t{alt}\t{qual}\t{filt}\t{set}' + ('\t.' * 8) + '\n'
-                ofile.write(oline)
 
+def print_stats(cache, handle=sys.stderr):
+    lookups = cache.hits + cache.misses
+    handle.write(
+        'ANN summary cache: {} lookups, {} hits, {} misses, hit rate {:.2%}\n'.format(
+            lookups, cache.hits, cache.misses, cache.hits / lookups if lookups else 0.0
+        )
+    )
 
 
 if __name__=="__main__":
-     infile, outfile, include_header, write_unannotated = parse_args()
-     parse_snpEff(infile, outfile, include_header, write_unannotated)
+     infile, outfile, include_header, write_unannotated, threads, stats = parse_args()
+     cache = parse_snpEff(infile, outfile, include_header, write_unannotated, threads)
+     if stats:
+         print_stats(cache)
 
     
 
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+"""
+Prepend the caller label to the INFO and FORMAT keys of a VCF.
+
+Python replacement for prepend_labels_stdin.sh with identical output:
+- ##INFO / ##FORMAT header IDs get the <caller>_ prefix; the "Concordant Genotype"
+  GT FORMAT line and the <caller>_QUAL INFO line are added before <caller>_GT
+- INFO keys get the prefix and the record QUAL is kept as <caller>_QUAL
+- FORMAT becomes GT:<caller>_<key>... and every sample's GT is duplicated in front
+
+Lines are labeled in batches of --chunk-size lines; with --threads N > 1 the batches
+are labeled by a pool of worker processes and written back in input order.
+"""
+
+import argparse
+import collections
+import multiprocessing
+
+from vcf_io import open_vcf, open_vcf_output
+
+CHUNK_SIZE = 1000
+
+
+def get_args():
+    """Handle command line arguments (caller label, input and output file names)."""
+    parser = argparse.ArgumentParser(description="Prepend the caller label to the INFO and FORMAT fields of a VCF.")
+    parser.add_argument("caller", help="Caller label, e.g. HC, DV or strelka2.")
+    parser.add_argument("infile", nargs="?", default=None, help="Input VCF file, plain or bgzip compressed (default: stdin).")
+    parser.add_argument("outfile", nargs="?", default=None, help="Output VCF file (default: stdout).")
+    parser.add_argument(
+        "-O",
+        "--output-type",
+        choices=["v", "z"],
+        default=None,
+        help="Output type: v = uncompressed VCF, z = BGZF compressed VCF (default: z if outfile ends with .gz, otherwise v).",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=CHUNK_SIZE,
+        help="Number of lines labeled per batch (default: {}).".format(CHUNK_SIZE),
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="Number of worker processes labeling batches of lines (default: 1).",
+    )
+    return parser.parse_args()
+
+
+def label_header_line(line, caller):
+    """Header line(s) as written by prepend_labels_stdin.sh for caller (bytes, no newline)."""
+    if line.startswith(b"##INFO=<ID="):
+        return [b"##INFO=<ID=" + caller + b"_" + line[len(b"##INFO=<ID="):]]
+    if line.startswith(b"##FORMAT=<ID="):
+        line = b"##FORMAT=<ID=" + caller + b"_" + line[len(b"##FORMAT=<ID="):]
+        if line.startswith(b"##FORMAT=<ID=" + caller + b"_GT"):
+            return [
+                b'##FORMAT=<ID=GT,Number=1,Type=String,Description="Concordant Genotype">',
+                b"##INFO=<ID=" + caller + b'_QUAL,Number=1,Type=String,Description="Record of original QUAL value">',
+                line,
+            ]
+    return [line]
+
+
+def label_keys(keys, caller, separator):
+    """Prefix every separator-delimited key with caller_ (nothing to prefix when empty, as awk's split)."""
+    if not keys:
+        return b""
+    prefix = caller + b"_"
+    return prefix + keys.replace(separator, separator + prefix)
+
+
+def label_info(info_field, qual_field, caller):
+    """INFO column as written by prepend_labels_stdin.sh for caller."""
+    return label_keys(info_field, caller, b";") + b";" + caller + b"_QUAL=" + qual_field
+
+
+def label_samples(samples):
+    """Duplicate the GT (first sub-field) in front of every tab separated sample column."""
+    return b"\t".join([sample.partition(b":")[0] + b":" + sample for sample in samples.split(b"\t")])
+
+
+def label_line(line, caller):
+    """Label one VCF line (bytes, without the newline)."""
+    if line.startswith(b"#"):
+        return b"\n".join(label_header_line(line, caller))
+    fields = line.split(b"\t", 9)
+    samples = label_samples(fields.pop()) if len(fields) == 10 else b""
+    if len(fields) < 9:
+        fields += [b""] * (9 - len(fields))
+    fields[7] = label_info(fields[7], fields[5], caller)
+    fields[8] = b"GT:" + label_keys(fields[8], caller, b":")
+    fields.append(samples)
+    return b"\t".join(fields)
+
+
+def label_chunk(lines, caller):
+    """Label a batch of newline-terminated lines and return them as one block of bytes."""
+    return b"".join([label_line(line[:-1] if line.endswith(b"\n") else line, caller) + b"\n" for line in lines])
+
+
+# caller label of the worker processes of the --threads pool
+_worker_caller = None
+
+
+def _init_worker(caller):
+    global _worker_caller
+    _worker_caller = caller
+
+
+def _label_block(block):
+    """Worker task: label a block of newline-terminated lines."""
+    return label_chunk(block.split(b"\n")[:-1], _worker_caller)
+
+
+def prepend_labels(in_handle, out_handle, caller, chunk_size=CHUNK_SIZE, threads=1):
+    """Label every line of a binary VCF stream, chunk_size lines at a time."""
+    if threads <= 1:
+        chunk = []
+        for line in in_handle:
+            chunk.append(line)
+            if len(chunk) >= chunk_size:
+                out_handle.write(label_chunk(chunk, caller))
+                chunk = []
+        if chunk:
+            out_handle.write(label_chunk(chunk, caller))
+        return
+
+    with multiprocessing.Pool(threads, initializer=_init_worker, initargs=(caller,)) as pool:
+        # bounded so the reader can not run arbitrarily far ahead of the workers
+        pending = collections.deque()
+        chunk = []
+        for line in in_handle:
+            chunk.append(line if line.endswith(b"\n") else line + b"\n")
+            if len(chunk) >= chunk_size:
+                pending.append(pool.apply_async(_label_block, (b"".join(chunk),)))
+                chunk = []
+                while len(pending) > 2 * threads:
+                    out_handle.write(pending.popleft().get())
+        if chunk:
+            pending.append(pool.apply_async(_label_block, (b"".join(chunk),)))
+        while pending:
+            out_handle.write(pending.popleft().get())
+
+
+if __name__ == "__main__":
+    args = get_args()
+    with open_vcf(args.infile, "vcf", args.threads) as in_handle, open_vcf_output(
+        args.outfile, args.output_type, args.threads
+    ) as out:
+        prepend_labels(in_handle, out, args.caller.encode(), args.chunk_size, args.threads)
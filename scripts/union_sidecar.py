@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+"""
+Columnar sidecar of a genotype_union.py run, so concordance QC can read the union
+calls with mmap instead of re-parsing the merged VCF text.
+
+A sidecar with prefix P is a set of NumPy .npy files plus a JSON index, one row per
+VCF record in output order:
+
+    P.index.json          samples, contigs, code tables and array shapes
+    P.chrom.npy           uint16 (variants,)  index into "contigs"
+    P.pos.npy             int64  (variants,)  POS
+    P.caller_set.npy      uint8  (variants,)  caller bit mask, HC=1 DV=2 strelka2=4
+    P.concensus_GT.npy    uint8  (variants, ceil(samples / 4))
+    P.dv_priority_GT.npy  uint8  (variants, ceil(samples / 4))
+
+Genotypes are 2-bit codes (0 no call, 1 hom ref, 2 het, 3 hom alt) packed four
+samples to a byte, sample i in bits 2 * (i % 4). Use load_sidecar and unpack_codes:
+
+    index, arrays = load_sidecar(P)
+    concensus = unpack_codes(arrays["concensus_GT"], len(index["samples"]))
+"""
+
+import json
+
+import numpy as np
+
+GT_NO_CALL, GT_HOM_REF, GT_HET, GT_HOM_ALT = range(4)
+GT_CODE_NAMES = ["no call", "hom ref", "het", "hom alt"]
+CALLER_BITS = {"HC": 1, "DV": 2, "strelka2": 4}
+ARRAYS = ("chrom", "pos", "caller_set", "concensus_GT", "dv_priority_GT")
+SIDECAR_VERSION = 1
+
+
+def genotype_code(gt):
+    """2-bit code of a GT string (bytes)."""
+    if not gt or b"." in gt:
+        return GT_NO_CALL
+    alleles = gt.replace(b"|", b"/").split(b"/")
+    alt_alleles = sum(allele != b"0" for allele in alleles)
+    if alt_alleles == 0:
+        return GT_HOM_REF
+    return GT_HOM_ALT if alt_alleles == len(alleles) else GT_HET
+
+
+class GenotypeCodes(dict):
+    """GT string -> 2-bit code memo."""
+
+    def __missing__(self, gt):
+        code = self[gt] = genotype_code(gt)
+        return code
+
+
+class CallerSets(dict):
+    """Union FORMAT string -> caller bit mask memo."""
+
+    def __missing__(self, format_field):
+        mask = sum(bit for caller, bit in CALLER_BITS.items() if b":" + caller.encode() + b"_" in format_field)
+        self[format_field] = mask
+        return mask
+
+
+def pack_codes(codes):
+    """Pack a (variants, samples) uint8 array of 2-bit codes four samples to a byte."""
+    padding = -codes.shape[1] % 4
+    if padding:
+        codes = np.pad(codes, ((0, 0), (0, padding)))
+    return codes[:, 0::4] | (codes[:, 1::4] << 2) | (codes[:, 2::4] << 4) | (codes[:, 3::4] << 6)
+
+
+def unpack_codes(packed, num_samples):
+    """Inverse of pack_codes: (variants, samples) uint8 array of 2-bit codes."""
+    packed = np.asarray(packed)
+    codes = np.empty((packed.shape[0], packed.shape[1] * 4), dtype=np.uint8)
+    for shift in range(4):
+        codes[:, shift::4] = (packed >> (2 * shift)) & 3
+    return codes[:, :num_samples]
+
+
+class SidecarChunk:
+    """Extracts the sidecar columns from unioned VCF lines. Every unioned sample ends
+    in :concensus_GT:dv_priority_GT, whatever the caller set, so one rsplit per sample
+    gives both calls.
+    """
+
+    def __init__(self):
+        self.genotype_codes = GenotypeCodes()
+        self.caller_sets = CallerSets()
+
+    def __call__(self, lines):
+        """lines: unioned VCF data lines (bytes). Returns (chroms, pos, caller_set,
+        packed concensus_GT, packed dv_priority_GT).
+        """
+        codes = self.genotype_codes
+        chroms = []
+        positions = []
+        caller_sets = []
+        concensus = []
+        dv_priority = []
+        for line in lines:
+            fields = line.rstrip(b"\r\n").split(b"\t")
+            chroms.append(fields[0])
+            positions.append(int(fields[1]))
+            caller_sets.append(self.caller_sets[fields[8]])
+            calls = [sample.rsplit(b":", 2) for sample in fields[9:]]
+            concensus.append([codes[call[-2]] for call in calls])
+            dv_priority.append([codes[call[-1]] for call in calls])
+        return (
+            chroms,
+            np.array(positions, dtype=np.int64),
+            np.array(caller_sets, dtype=np.uint8),
+            pack_codes(np.array(concensus, dtype=np.uint8).reshape(len(lines), -1)),
+            pack_codes(np.array(dv_priority, dtype=np.uint8).reshape(len(lines), -1)),
+        )
+
+
+class NpyAppender:
+    """Append rows to a .npy file whose length is not known up front. The row count
+    in the header is written with a fixed width and patched in place on close.
+    """
+
+    def __init__(self, path, dtype, row_width=None):
+        self.handle = open(path, "wb")
+        self.dtype = np.dtype(dtype)
+        self.row_width = row_width
+        self.rows = 0
+        self.handle.write(self.header())
+
+    def header(self):
+        if self.row_width is None:
+            shape = "({:20d},)".format(self.rows)
+        else:
+            shape = "({:20d}, {})".format(self.rows, self.row_width)
+        header = "{{'descr': {!r}, 'fortran_order': False, 'shape': {}, }}".format(self.dtype.str, shape)
+        # magic (6) + version (2) + header length (2) + header, padded to 64 bytes with a closing newline
+        length = -(-(10 + len(header) + 1) // 64) * 64 - 10
+        return b"\x93NUMPY\x01\x00" + length.to_bytes(2, "little") + header.ljust(length - 1).encode("latin1") + b"\n"
+
+    def append(self, array):
+        self.handle.write(np.ascontiguousarray(array, dtype=self.dtype).tobytes())
+        self.rows += len(array)
+
+    def close(self):
+        self.handle.seek(0)
+        self.handle.write(self.header())
+        self.handle.close()
+
+
+class SidecarWriter:
+    """Writes the sidecar of a union run from the chunks returned by SidecarChunk."""
+
+    extractor = SidecarChunk
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.samples = None
+        self.num_samples = None
+        self.contigs = {}
+        self.arrays = None
+
+    def set_samples(self, samples):
+        self.samples = [sample.decode() if isinstance(sample, bytes) else sample for sample in samples]
+
+    def open(self, num_samples):
+        self.num_samples = num_samples
+        packed_width = -(-num_samples // 4)
+        self.arrays = {
+            "chrom": NpyAppender(self.path("chrom"), np.uint16),
+            "pos": NpyAppender(self.path("pos"), np.int64),
+            "caller_set": NpyAppender(self.path("caller_set"), np.uint8),
+            "concensus_GT": NpyAppender(self.path("concensus_GT"), np.uint8, packed_width),
+            "dv_priority_GT": NpyAppender(self.path("dv_priority_GT"), np.uint8, packed_width),
+        }
+
+    def path(self, name):
+        return "{}.{}.npy".format(self.prefix, name)
+
+    def write(self, chunk, num_samples):
+        chroms, positions, caller_sets, concensus, dv_priority = chunk
+        if self.arrays is None:
+            self.open(num_samples)
+        contigs = self.contigs
+        chrom_codes = [contigs.setdefault(chrom, len(contigs)) for chrom in chroms]
+        self.arrays["chrom"].append(np.array(chrom_codes, dtype=np.uint16))
+        self.arrays["pos"].append(positions)
+        self.arrays["caller_set"].append(caller_sets)
+        self.arrays["concensus_GT"].append(concensus)
+        self.arrays["dv_priority_GT"].append(dv_priority)
+
+    def close(self, num_samples=0):
+        if self.arrays is None:
+            self.open(num_samples)
+        num_variants = self.arrays["pos"].rows
+        for array in self.arrays.values():
+            array.close()
+        index = {
+            "version": SIDECAR_VERSION,
+            "num_variants": num_variants,
+            "samples": self.samples if self.samples is not None else [str(i) for i in range(self.num_samples)],
+            "contigs": [contig.decode() for contig in self.contigs],
+            "caller_bits": CALLER_BITS,
+            "genotype_codes": GT_CODE_NAMES,
+            "arrays": {name: "{}.{}.npy".format(self.prefix.rsplit("/", 1)[-1], name) for name in ARRAYS},
+        }
+        with open("{}.index.json".format(self.prefix), "w") as ofile:
+            json.dump(index, ofile, indent=1)
+
+
+def load_sidecar(prefix, mmap_mode="r"):
+    """Read a sidecar index and memory map its arrays. Returns (index, {name: array})."""
+    with open("{}.index.json".format(prefix)) as ifile:
+        index = json.load(ifile)
+    arrays = {name: np.load("{}.{}.npy".format(prefix, name), mmap_mode=mmap_mode) for name in ARRAYS}
+    return index, arrays
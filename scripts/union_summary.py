@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+"""
+Concordance summary of genotype_union.py output.
+
+genotype_union.py --summary FILE.json accumulates, while it streams:
+- records per caller set (HC, DV, HC-DV, ...) and variant type (SNP, INS, DEL, other)
+- per sample, over the records called by two or three callers: how often the callers'
+  genotypes were concordant (concensus_GT called), discordant (concensus_GT ./. while
+  at least one caller called the sample) or all missing
+
+All counts live in fixed-size arrays, so summaries of split intervals add up. Run as
+a script to reduce the per-interval summaries into one JSON and optional TSV tables:
+
+    union_summary.py -o harmonized.summary.json [--tsv harmonized.summary] interval*.summary.json
+"""
+
+import argparse
+import json
+import operator
+
+import numpy as np
+
+# caller bit mask (HC=1, DV=2, strelka2=4) - 1 -> set tag
+SETS = ["HC", "DV", "HC-DV", "strelka2", "HC-strelka2", "DV-strelka2", "HC-DV-strelka2"]
+CALLER_GT_KEYS = ((1, b"HC_GT"), (2, b"DV_GT"), (4, b"strelka2_GT"))
+VARIANT_TYPES = ["SNP", "INS", "DEL", "other"]
+SNP, INS, DEL, OTHER = range(4)
+SAMPLE_CATEGORIES = ["concordant", "discordant", "missing"]
+CONCORDANT, DISCORDANT, MISSING = range(3)
+SUMMARY_VERSION = 1
+
+
+def variant_type(ref, alt):
+    if alt.startswith(b"<") or alt == b"*" or b"," in alt:
+        return OTHER
+    if len(ref) == len(alt):
+        return SNP if len(ref) == 1 else OTHER
+    return INS if len(ref) < len(alt) else DEL
+
+
+class FormatKeys(dict):
+    """Union FORMAT string -> (set index, number of sub-fields, getter of the callers' GT
+    sub-fields + concensus_GT, indices of the callers' GT sub-fields).
+    """
+
+    def __missing__(self, format_field):
+        keys = format_field.split(b":")
+        mask = 0
+        indices = []
+        for bit, key in CALLER_GT_KEYS:
+            if key in keys:
+                mask |= bit
+                indices.append(keys.index(key))
+        getter = operator.itemgetter(*indices, len(keys) - 2)  # + concensus_GT
+        value = self[format_field] = (mask - 1, len(keys), getter, tuple(indices))
+        return value
+
+
+def truncated_gts(sub_fields, indices):
+    """(caller GTs..., concensus_GT) of a sample with fewer sub-fields than its FORMAT, e.g.
+    a caller sample truncated to ./. in the merged VCF. Every unioned sample still ends in
+    :concensus_GT:dv_priority_GT; caller GTs past the caller sub-fields are missing.
+    """
+    callers = len(sub_fields) - 2
+    return tuple(sub_fields[i] if i < callers else b"." for i in indices) + (sub_fields[-2],)
+
+
+class SampleCategories(dict):
+    """(caller GTs..., concensus_GT) -> sample category."""
+
+    def __missing__(self, gts):
+        if b"." not in gts[-1]:
+            category = CONCORDANT
+        elif any(b"." not in gt for gt in gts[:-1]):
+            category = DISCORDANT
+        else:
+            category = MISSING
+        self[gts] = category
+        return category
+
+
+class SummaryChunk:
+    """Counts of a chunk of unioned VCF lines: (set x variant type counts, sample x category counts)."""
+
+    def __init__(self):
+        self.format_keys = FormatKeys()
+        self.categories = SampleCategories()
+
+    def __call__(self, lines):
+        set_types = np.zeros((len(SETS), len(VARIANT_TYPES)), dtype=np.int64)
+        categories = self.categories
+        rows = []
+        for line in lines:
+            fields = line.rstrip(b"\r\n").split(b"\t")
+            set_index, num_keys, gt_getter, indices = self.format_keys[fields[8]]
+            set_types[set_index, variant_type(fields[3], fields[4])] += 1
+            if set_index + 1 in (1, 2, 4):
+                continue  # one caller: nothing to compare
+            row = []
+            for sample in fields[9:]:
+                sub_fields = sample.split(b":")
+                row.append(categories[gt_getter(sub_fields) if len(sub_fields) == num_keys else truncated_gts(sub_fields, indices)])
+            rows.append(row)
+        if rows:
+            rows = np.array(rows, dtype=np.uint8)
+            sample_counts = np.stack([(rows == category).sum(axis=0) for category in range(len(SAMPLE_CATEGORIES))], axis=1)
+        else:
+            sample_counts = None
+        return set_types, sample_counts
+
+
+class ConcordanceSummary:
+    """Fixed-size concordance counters of a union run (or of reduced runs)."""
+
+    extractor = SummaryChunk
+
+    def __init__(self, path=None):
+        self.path = path
+        self.samples = None
+        self.set_types = np.zeros((len(SETS), len(VARIANT_TYPES)), dtype=np.int64)
+        self.sample_counts = None
+
+    def set_samples(self, samples):
+        self.samples = [sample.decode() if isinstance(sample, bytes) else sample for sample in samples]
+
+    def write(self, chunk, num_samples):
+        set_types, sample_counts = chunk
+        self.set_types += set_types
+        if self.sample_counts is None:
+            self.sample_counts = np.zeros((num_samples, len(SAMPLE_CATEGORIES)), dtype=np.int64)
+        if sample_counts is not None:
+            self.sample_counts += sample_counts
+
+    def close(self, num_samples=0):
+        if self.sample_counts is None:
+            self.sample_counts = np.zeros((num_samples, len(SAMPLE_CATEGORIES)), dtype=np.int64)
+        if self.path is not None:
+            with open(self.path, "w") as ofile:
+                json.dump(self.to_dict(), ofile, indent=1)
+
+    def to_dict(self):
+        samples = self.samples if self.samples is not None else [str(i) for i in range(len(self.sample_counts))]
+        return {
+            "version": SUMMARY_VERSION,
+            "sets": SETS,
+            "variant_types": VARIANT_TYPES,
+            "set_variant_type_counts": self.set_types.tolist(),
+            "sample_categories": SAMPLE_CATEGORIES,
+            "samples": samples,
+            "sample_counts": self.sample_counts.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, summary):
+        if summary["version"] != SUMMARY_VERSION:
+            raise ValueError("ERROR: unsupported summary version {}".format(summary["version"]))
+        result = cls()
+        result.samples = summary["samples"]
+        result.set_types = np.array(summary["set_variant_type_counts"], dtype=np.int64).reshape(len(SETS), len(VARIANT_TYPES))
+        result.sample_counts = np.array(summary["sample_counts"], dtype=np.int64).reshape(len(result.samples), len(SAMPLE_CATEGORIES))
+        return result
+
+    def add(self, other):
+        """Add the counts of another summary (same samples, e.g. another interval)."""
+        if self.samples is None:
+            self.samples = other.samples
+            self.sample_counts = other.sample_counts.copy()
+        elif other.samples != self.samples:
+            raise ValueError("ERROR: summaries of different sample sets can not be reduced")
+        else:
+            self.sample_counts += other.sample_counts
+        self.set_types += other.set_types
+
+    def write_tsv(self, prefix):
+        """prefix.sets.tsv (set x variant type) and prefix.samples.tsv (sample x category)."""
+        with open(prefix + ".sets.tsv", "w") as ofile:
+            ofile.write("\t".join(["set"] + VARIANT_TYPES + ["total"]) + "\n")
+            for name, counts in zip(SETS, self.set_types.tolist()):
+                ofile.write("\t".join([name] + [str(c) for c in counts] + [str(sum(counts))]) + "\n")
+        with open(prefix + ".samples.tsv", "w") as ofile:
+            ofile.write("\t".join(["sample"] + SAMPLE_CATEGORIES + ["discordance_rate"]) + "\n")
+            for name, counts in zip(self.samples, self.sample_counts.tolist()):
+                called = counts[CONCORDANT] + counts[DISCORDANT]
+                rate = "{:.6f}".format(counts[DISCORDANT] / called) if called else "NA"
+                ofile.write("\t".join([name] + [str(c) for c in counts] + [rate]) + "\n")
+
+
+def reduce_summaries(paths):
+    total = ConcordanceSummary()
+    for path in paths:
+        with open(path) as ifile:
+            total.add(ConcordanceSummary.from_dict(json.load(ifile)))
+    return total
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Reduce per-interval genotype_union.py --summary files into one summary")
+    parser.add_argument("summaries", nargs="+", help="genotype_union.py --summary JSON files")
+    parser.add_argument("-o", "--output", required=True, help="Reduced summary JSON")
+    parser.add_argument("--tsv", metavar="PREFIX", default=None, help="Also write PREFIX.sets.tsv and PREFIX.samples.tsv")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = get_args()
+    summary = reduce_summaries(args.summaries)
+    with open(args.output, "w") as ofile:
+        json.dump(summary.to_dict(), ofile, indent=1)
+    if args.tsv is not None:
+        summary.write_tsv(args.tsv)
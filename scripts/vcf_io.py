@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+"""
+Shared VCF stream helpers for the harmonize/annotate scripts.
+
+- open_vcf: binary line iterator over plain, gzip/bgzip compressed VCF or BCF.
+  BGZF is decompressed by htslib's bgzip on `threads` threads, BCF is decoded by
+  htslib through pysam (only needed for BCF).
+- open_vcf_output: plain or BGZF compressed output, compressed by bgzip.
+"""
+
+import gzip
+import os
+import shutil
+import signal
+import subprocess
+import sys
+from contextlib import ExitStack, contextmanager
+
+GZIP_MAGIC = b"\x1f\x8b"
+BCF_MAGIC = b"BCF"
+PIPE_BUFFER = 1 << 20
+
+
+def is_bgzf(head):
+    """True if head (at least the first 16 bytes of a file) starts a BGZF block."""
+    return len(head) >= 16 and head[:4] == b"\x1f\x8b\x08\x04" and head[12:14] == b"BC"
+
+
+def _bgzip(arguments, **kwargs):
+    """Start htslib's bgzip with arguments; bgzip validates every block it reads."""
+    bgzip = shutil.which("bgzip")
+    if bgzip is None:
+        sys.exit("ERROR: reading or writing BGZF requires bgzip (htslib) on the PATH")
+    return subprocess.Popen([bgzip] + arguments, bufsize=PIPE_BUFFER, **kwargs)
+
+
+def _check_bgzip(process, reading):
+    returncode = process.wait()
+    # a reader closed before the end of the input stops bgzip with SIGPIPE
+    if returncode != 0 and not (reading and returncode == -signal.SIGPIPE):
+        raise IOError(f"ERROR: bgzip exited with status {returncode}")
+
+
+@contextmanager
+def _bgzf_reader(raw, path, threads):
+    """Yield the decompressed content of the BGZF path, or of the rest of raw for stdin."""
+    arguments = ["-d", "-c", "--threads", str(threads)]
+    feeder = None
+    if path is None:
+        # bgzip reads the bytes raw buffered while peeking, then the rest of stdin
+        # through cat: no pipe write end stays open here for forked workers to inherit
+        read_end, write_end = os.pipe()
+        process = _bgzip(arguments, stdin=read_end, stdout=subprocess.PIPE)
+        os.close(read_end)
+        with open(write_end, "wb", closefd=False) as pipe:
+            pipe.write(raw.read(len(raw.peek(1))))
+        feeder = subprocess.Popen(["cat"], stdin=raw.fileno(), stdout=write_end)
+        os.close(write_end)
+    else:
+        process = _bgzip(arguments + [path], stdout=subprocess.PIPE)
+    try:
+        yield process.stdout
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        process.stdout.close()
+        if feeder is not None:
+            feeder.wait()
+    _check_bgzip(process, reading=True)
+
+
+@contextmanager
+def _bgzf_writer(handle, threads, level):
+    """Yield a binary writer whose data bgzip compresses to handle."""
+    handle.flush()
+    process = _bgzip(["-c", "--threads", str(threads), "-l", str(level)], stdin=subprocess.PIPE, stdout=handle)
+    try:
+        yield process.stdin
+    finally:
+        process.stdin.close()
+    _check_bgzip(process, reading=False)
+
+
+def _htslib_lines(path, threads):
+    """VCF text lines of a VCF/BCF decoded by htslib (pysam)."""
+    try:
+        import pysam
+    except ImportError:
+        sys.exit("ERROR: reading BCF requires pysam to be installed")
+    # streaming needs no index; keep htslib from warning that there is none
+    verbosity = pysam.set_verbosity(0)
+    try:
+        variant_file = pysam.VariantFile(path, threads=threads)
+    finally:
+        pysam.set_verbosity(verbosity)
+    with variant_file:
+        for line in str(variant_file.header).splitlines(keepends=True):
+            yield line.encode()
+        for record in variant_file:
+            yield str(record).encode()
+
+
+@contextmanager
+def open_vcf(path, input_format="auto", threads=1):
+    """Yield an iterator of binary lines of a VCF.
+
+    path: file name, or None / '-' for stdin
+    input_format:
+        'vcf'  - plain, gzip or BGZF compressed VCF text (BGZF is decompressed on `threads` threads)
+        'bcf'  - any format htslib reads (BCF, VCF, VCF.gz), decoded through pysam
+        'auto' - detect from the leading bytes. BCF arriving on stdin can not be
+                 detected without consuming it, so it needs input_format='bcf'.
+    """
+    from_stdin = path is None or path == "-"
+    if input_format == "bcf":
+        yield _htslib_lines("-" if from_stdin else path, threads)
+        return
+
+    with ExitStack() as stack:
+        raw = sys.stdin.buffer if from_stdin else stack.enter_context(open(path, "rb"))
+        reader = raw
+        head = raw.peek(18)[:18]
+        if is_bgzf(head):
+            reader = stack.enter_context(_bgzf_reader(raw, None if from_stdin else path, threads))
+        elif head[:2] == GZIP_MAGIC:
+            reader = stack.enter_context(gzip.GzipFile(fileobj=raw))
+        if reader.peek(3)[:3] != BCF_MAGIC:
+            yield reader
+            return
+        if input_format == "vcf" or from_stdin:
+            sys.exit("ERROR: input is BCF; use --input-format bcf")
+    yield _htslib_lines(path, threads)
+
+
+@contextmanager
+def open_vcf_output(path, output_type=None, threads=1, level=6):
+    """Yield a binary writer for path (None / '-' for stdout).
+
+    output_type: 'v' plain VCF, 'z' BGZF compressed VCF. Defaults to 'z' when
+    path ends with .gz, otherwise 'v'.
+    """
+    to_stdout = path is None or path == "-"
+    if output_type is None:
+        output_type = "z" if not to_stdout and path.endswith(".gz") else "v"
+    handle = sys.stdout.buffer if to_stdout else open(path, "wb")
+    try:
+        if output_type == "z":
+            with _bgzf_writer(handle, threads, level) as writer:
+                yield writer
+        else:
+            yield handle
+    finally:
+        if to_stdout:
+            handle.flush()
+        else:
+            handle.close()